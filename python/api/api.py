@@ -1,14 +1,20 @@
 import os
 from fastapi import FastAPI, File, UploadFile
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
-from services.office2txt import office_to_txt
+from services.office2txt import office_to_txt, iter_office_blocks, extract_blocks, format_blocks, EXTRACTOR_VERSION, EXTRACTOR_SETTINGS
 from typing import List
 from fastapi import HTTPException
 from services.fetch import get_summary
+from services.scheduler import JobScheduler, QueueFullError, JobTimeoutError
+from services.result_cache import ResultCache, result_key
+from services.archive import is_archive, unpack_archive
 import aiofiles
-import queue
-import uuid
+import asyncio
+import tempfile
+import hashlib
+import json
 
 
 # 请求模型
@@ -26,35 +32,232 @@ class ExtractedText(BaseModel):
     text: str
 
 
-# 文件转文本
-async def process_file(file: UploadFile):
-    file_ext = os.path.splitext(file.filename)[1].lower()
-    if file_ext not in ['.docx', '.pdf', '.doc', '.txt']:
-        return JSONResponse(content={"error": "Unsupported file format"}, status_code=400)
+# 文件提取的进程池调度器，由 main.py 在退出时关闭
+scheduler = JobScheduler()
+# 提取结果缓存，按文件内容去重（txt 文件不需要缓存）；等待相同内容的任务最多 scheduler.timeout 秒
+result_cache = ResultCache(wait_timeout=scheduler.timeout)
 
-    # 生成唯一的文件名
-    unique_filename = f"{uuid.uuid4()}{file_ext}"
 
+# 上传文件暂存设置：上传的内容边读取边写入 SPOOL_DIR（默认为 tmpfs 上的 /dev/shm）下的临时文件，
+# 工作进程按路径读取，文件内容只写一次，不再经过进程间传输
+SPOOL_DIR = os.environ.get('SPOOL_DIR', '/dev/shm' if os.path.isdir('/dev/shm') else None)
+SPOOL_CHUNK_SIZE = 1024 * 1024
+
+
+# 读取上传文件，返回 (tmp_path, digest)，digest 为文件内容的 SHA-256
+# 调用方负责删除 tmp_path
+async def spool_upload(file: UploadFile, suffix: str):
+    sha256 = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(suffix=suffix, dir=SPOOL_DIR)
+    os.close(fd)
     try:
-        # 读取文件内容并保存到唯一命名的文件中
-        async with aiofiles.open(unique_filename, "wb") as out_file:
+        async with aiofiles.open(tmp_path, "wb") as out_file:
             while True:
-                contents = await file.read(1024)  # 以块的方式读取文件
+                contents = await file.read(SPOOL_CHUNK_SIZE)
                 if not contents:
                     break
+                sha256.update(contents)
                 await out_file.write(contents)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return tmp_path, sha256.hexdigest()
+
+
+# 缓存的内容块可能来自另一个文件名相同内容的上传，输出时换成本次的文件名
+def with_document(blocks, filename):
+    document = os.path.basename(filename)
+    return [dict(block, document=document) for block in blocks]
+
+
+SUPPORTED_EXTENSIONS = ['.docx', '.pdf', '.doc', '.txt']
+
+
+# 提取一个已暂存的文件（source 为临时文件路径），返回文本
+# 相同内容的文件只提取一次：命中缓存直接返回，正在提取时等待同一个任务
+async def extract_source(source, filename, digest, wait=False):
+    file_ext = os.path.splitext(filename)[1].lower()
+    if file_ext == '.txt':
+        return await scheduler.submit(office_to_txt, source, filename, wait=wait)
+    key = result_key(digest, file_ext, EXTRACTOR_VERSION, EXTRACTOR_SETTINGS)
+    blocks = await result_cache.get_or_run(
+        key, lambda: scheduler.submit(extract_blocks, source, filename, wait=wait))
+    return format_blocks(with_document(blocks, filename), filename)
+
 
-        # 文件处理逻辑，注意传入新的唯一文件名
-        extracted_text = office_to_txt(unique_filename)
-        print(extracted_text)
+# 文件转文本
+async def process_file(file: UploadFile):
+    file_ext = os.path.splitext(file.filename)[1].lower()
+    if file_ext not in SUPPORTED_EXTENSIONS:
+        return JSONResponse(content={"error": "Unsupported file format"}, status_code=400)
+
+    tmp_path = None
+    try:
+        tmp_path, digest = await spool_upload(file, file_ext)
+
+        # 文件处理逻辑：解析器直接读取临时文件；在进程池中执行，不阻塞事件循环
+        extracted_text = await extract_source(tmp_path, file.filename, digest)
         return {"text": extracted_text}
+    except QueueFullError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=429,
+                            headers={"Retry-After": str(e.retry_after)})
+    except (JobTimeoutError, TimeoutError) as e:
+        return JSONResponse(content={"error": str(e)}, status_code=504)
     except Exception as e:
         return JSONResponse(content={"error": str(e)}, status_code=500)
     finally:
-        # 清理：删除临时保存的唯一命名文件
-        if os.path.exists(unique_filename):
-            os.remove(unique_filename)
+        # 清理：删除临时文件
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+# 流式输出的格式
+def format_ndjson(data):
+    return json.dumps(data, ensure_ascii=False) + "\n"
+
+def format_sse(data, event=None):
+    message = f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+    return f"event: {event}\n{message}" if event else message
+
+
+async def iter_blocks(blocks):
+    for block in blocks:
+        yield block
+
+# 等待正在执行的相同任务完成后输出它的结果
+async def iter_inflight(future, filename):
+    for block in with_document(await result_cache.wait(future), filename):
+        yield block
+
+# 边输出边收集，完整输出后写入缓存；中途出错或客户端断开时不缓存
+# 正在执行的任务由调用方在返回响应之前登记（result_cache.start）
+async def iter_and_cache(key, blocks):
+    collected = []
+    try:
+        async for block in blocks:
+            collected.append(block)
+            yield block
+    except BaseException as e:
+        result_cache.abort(key, e if isinstance(e, Exception) else RuntimeError('Extraction cancelled'))
+        raise
+    finally:
+        await blocks.aclose()
+    result_cache.finish(key, collected)
+
+
+# 文件转文本（流式）：每页或每段提取完成后立即输出
+# 每块为 {"document", "page", "text", "ocr_text"}，出错时输出 {"error"} 后结束
+async def process_file_stream(file: UploadFile, sse: bool = False):
+    file_ext = os.path.splitext(file.filename)[1].lower()
+    if file_ext not in SUPPORTED_EXTENSIONS:
+        return JSONResponse(content={"error": "Unsupported file format"}, status_code=400)
+
+    tmp_path, digest = await spool_upload(file, file_ext)
+    key = result_key(digest, file_ext, EXTRACTOR_VERSION, EXTRACTOR_SETTINGS) if file_ext != '.txt' else None
+    job = None
+    started = None
+    try:
+        cached = await result_cache.aget(key) if key else None
+        # 从这里到登记任务之间没有 await：同时到达的相同请求只有一个会执行提取
+        inflight = result_cache.inflight(key) if key else None
+        if cached is not None:
+            blocks = iter_blocks(with_document(cached, file.filename))
+        elif inflight is not None:
+            blocks = iter_inflight(inflight, file.filename)
+        else:
+            job = blocks = scheduler.stream(iter_office_blocks, tmp_path, file.filename)
+            if key:
+                started = result_cache.start(key)
+                blocks = iter_and_cache(key, blocks)
+    except Exception as e:
+        os.remove(tmp_path)
+        if isinstance(e, QueueFullError):
+            return JSONResponse(content={"error": str(e)}, status_code=429,
+                                headers={"Retry-After": str(e.retry_after)})
+        return JSONResponse(content={"error": str(e)}, status_code=500)
+
+    async def body():
+        try:
+            async for block in blocks:
+                yield format_sse(block) if sse else format_ndjson(block)
+        except Exception as e:
+            error = {"error": str(e)}
+            yield format_sse(error, event="error") if sse else format_ndjson(error)
+
+    # 清理放在响应结束后执行的后台任务中：响应可能在开始读取 body 之前就被取消（例如客户端上传完即断开），
+    # 从未开始的 body 不会执行 finally。这里停止工作进程中的任务、放弃登记的任务并删除临时文件
+    async def cleanup():
+        await blocks.aclose()
+        if job is not None:
+            await job.aclose()
+        if started is not None and not started.done():
+            result_cache.abort(key, RuntimeError('Extraction cancelled'))
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    media_type = "text/event-stream" if sse else "application/x-ndjson"
+    return StreamingResponse(body(), media_type=media_type, background=BackgroundTask(cleanup))
+
+
+# 批量提取设置：单次请求最多的文件数（包括压缩包中的文件）
+BATCH_MAX_FILES = int(os.environ.get('BATCH_MAX_FILES', 1000))
+
+
+def remove_files(paths):
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+# 批量文件转文本：上传多个文件或压缩包（zip、tar），所有文件分发到进程池并行提取，
+# 每个文件完成后立即输出一行 {"filename", "text"} 或 {"filename", "error"}（NDJSON，按完成顺序）
+async def process_batch(files: List[UploadFile]):
+    entries = []
+    tmp_paths = []
+    try:
+        for file in files:
+            tmp_path, digest = await spool_upload(file, os.path.splitext(file.filename)[1].lower())
+            tmp_paths.append(tmp_path)
+            if is_archive(file.filename):
+                loop = asyncio.get_running_loop()
+                members = await loop.run_in_executor(
+                    None, unpack_archive, tmp_path, file.filename, SUPPORTED_EXTENSIONS, BATCH_MAX_FILES)
+                tmp_paths.extend(member_path for _, member_path, _ in members)
+                entries.extend(members)
+            else:
+                entries.append((file.filename, tmp_path, digest))
+            if len(entries) > BATCH_MAX_FILES:
+                raise ValueError(f"Too many files, at most {BATCH_MAX_FILES} per request")
+    except BaseException as e:
+        remove_files(tmp_paths)
+        if not isinstance(e, Exception):
+            raise
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+
+    # 同时提交的任务数与工作进程数相同，给单文件请求留出排队名额
+    semaphore = asyncio.Semaphore(scheduler.max_workers)
+
+    async def run(filename, source, digest):
+        if os.path.splitext(filename)[1].lower() not in SUPPORTED_EXTENSIONS:
+            return {"filename": filename, "error": "Unsupported file format"}
+        try:
+            async with semaphore:
+                return {"filename": filename, "text": await extract_source(source, filename, digest, wait=True)}
+        except Exception as e:
+            return {"filename": filename, "error": str(e)}
+
+    async def body():
+        tasks = [asyncio.ensure_future(run(*entry)) for entry in entries]
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield format_ndjson(await task)
+        finally:
+            for task in tasks:
+                task.cancel()
 
+    # 临时文件在响应结束后的后台任务中删除：响应在开始读取 body 之前就被取消时，body 的 finally 不会执行
+    return StreamingResponse(body(), media_type="application/x-ndjson",
+                             background=BackgroundTask(remove_files, tmp_paths))
 
 
 # 定义一个处理网页摘要的函数
@@ -62,10 +265,9 @@ async def process_summary(request):
     if request.level < 0:
         raise HTTPException(status_code=400, detail="Level must be non-negative.")
     try:
-        # 使用定义的函数来获取网页摘要
-        summaries = get_summary(request.url, request.level)
+        # 使用定义的函数来获取网页摘要，并发抓取，超过总时限时返回部分结果
+        summaries = await get_summary(request.url, request.level)
         # 将结果转换为响应模型列表
-        print(summaries)
         return [SummaryResponse(url=url, title=title, summary=summary) for url, title, summary in summaries]
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
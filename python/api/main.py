@@ -1,8 +1,8 @@
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi import FastAPI, File, UploadFile
-import queue
+from fastapi import FastAPI, File, UploadFile, Request
 from typing import List
-from api import SummaryRequest, SummaryResponse, ExtractedText,process_file,process_summary
+from api import SummaryRequest, SummaryResponse, ExtractedText,process_file,process_file_stream,process_batch,process_summary,scheduler,result_cache
+from services.fetch import fetch_cache
 import uvicorn
 
 app = FastAPI()
@@ -16,33 +16,34 @@ app.add_middleware(
 )
 
 
-q = queue.Queue()
+@app.on_event("shutdown")
+def shutdown_scheduler():
+    scheduler.shutdown()
 
-# 定义一个接口，接收文件并将其放入队列中
+# 定义一个接口，接收文件并交给进程池调度器处理
+# 队列已满时返回 429 和 Retry-After，单个任务超时返回 504
+# stream=true 时逐页输出 NDJSON；请求头 Accept 为 text/event-stream 时输出 SSE
 @app.post("/extract_text/", response_model=ExtractedText)
-async def extract_text(file: UploadFile = File(...)):
-    # 将文件对象放入队列中，先进先出
-    q.put(file)
-    # 从队列中取出文件对象，并调用处理函数
-    file = q.get()
-    result = await process_file(file)
-    # 标记队列中的任务已完成
-    q.task_done()
-    # 返回处理结果
-    return result
-
-# 定义一个接口，接收请求并将其放入队列中
+async def extract_text(request: Request, file: UploadFile = File(...), stream: bool = False):
+    if stream:
+        sse = "text/event-stream" in request.headers.get("accept", "")
+        return await process_file_stream(file, sse)
+    return await process_file(file)
+
+# 批量提取：接收多个文件或 zip/tar 压缩包，按完成顺序逐个输出 NDJSON
+@app.post("/extract_text/batch/")
+async def extract_text_batch(files: List[UploadFile] = File(...)):
+    return await process_batch(files)
+
+# 缓存命中情况，用于调整缓存大小
+@app.get("/cache_stats/")
+async def cache_stats():
+    return {"extract": result_cache.stats(), "fetch": fetch_cache.stats()}
+
+# 定义一个接口，接收请求并生成网页摘要
 @app.post("/generate_summary/", response_model=List[SummaryResponse])
 async def generate_summary(request: SummaryRequest):
-    # 将请求对象放入队列中，先进先出
-    q.put(request)
-    # 从队列中取出请求对象，并调用处理函数
-    request = q.get()
-    result = await process_summary(request)
-    # 标记队列中的任务已完成
-    q.task_done()
-    # 返回处理结果
-    return result
+    return await process_summary(request)
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=6010)
\ No newline at end of file
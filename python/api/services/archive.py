@@ -0,0 +1,89 @@
+import os
+import hashlib
+import tarfile
+import tempfile
+import zipfile
+
+
+ARCHIVE_EXTENSIONS = ('.zip', '.tar', '.tar.gz', '.tgz')
+# 压缩包限制（防止解压炸弹）：最多的条目数（包括目录和跳过的文件），单个文件和全部文件解压后的字节数上限
+ARCHIVE_MAX_MEMBERS = int(os.environ.get('ARCHIVE_MAX_MEMBERS', 10000))
+ARCHIVE_MAX_MEMBER_SIZE = int(os.environ.get('ARCHIVE_MAX_MEMBER_SIZE', 100 * 1024 * 1024))
+ARCHIVE_MAX_TOTAL_SIZE = int(os.environ.get('ARCHIVE_MAX_TOTAL_SIZE', 1024 * 1024 * 1024))
+# 解压出的文件写入的目录，默认为系统临时目录（磁盘）：解压后的总大小可达 ARCHIVE_MAX_TOTAL_SIZE，
+# 放在 tmpfs（例如 Docker 默认只有 64MB 的 /dev/shm）上会占用内存
+ARCHIVE_SPOOL_DIR = os.environ.get('ARCHIVE_SPOOL_DIR')
+ARCHIVE_CHUNK_SIZE = 1024 * 1024
+
+
+def is_archive(filename):
+    return filename.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+class ArchiveLimitError(ValueError):
+    pass
+
+
+# 把压缩包中的一个文件边解压边写入 ARCHIVE_SPOOL_DIR 下的临时文件，返回 (临时文件路径, SHA-256, 字节数)
+# 声明的大小可能是伪造的，解压过程中仍然检查单个文件和总大小的上限
+def spool_member(member_file, name, budget):
+    limit = min(ARCHIVE_MAX_MEMBER_SIZE, budget)
+    sha256 = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(suffix=os.path.splitext(name)[1].lower(), dir=ARCHIVE_SPOOL_DIR)
+    try:
+        with os.fdopen(fd, 'wb') as out_file:
+            while True:
+                contents = member_file.read(ARCHIVE_CHUNK_SIZE)
+                if not contents:
+                    break
+                size += len(contents)
+                if size > limit:
+                    raise ArchiveLimitError(f"{name} is too large after decompression")
+                sha256.update(contents)
+                out_file.write(contents)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return tmp_path, sha256.hexdigest(), size
+
+
+# 逐个列出压缩包中的条目，返回 (文件名, 是否为文件, 声明的大小, 打开函数)
+def iter_archive(archive, filename):
+    if filename.lower().endswith('.zip'):
+        for info in archive.infolist():
+            yield info.filename, not info.is_dir(), info.file_size, lambda info=info: archive.open(info)
+    else:
+        for member in archive:
+            yield member.name, member.isfile(), member.size, lambda member=member: archive.extractfile(member)
+
+
+# 展开压缩包，返回 [(文件名, 临时文件路径, SHA-256)]，跳过目录和扩展名不在 extensions 中的文件
+# source 为压缩包的临时文件路径；超过 ARCHIVE_MAX_* 或 max_files 时抛出 ArchiveLimitError，
+# 此时已展开的临时文件会被删除，成功时由调用方删除
+def unpack_archive(source, filename, extensions, max_files):
+    members = []
+    total_size = 0
+    opener = zipfile.ZipFile if filename.lower().endswith('.zip') else tarfile.open
+    try:
+        with opener(source) as archive:
+            for count, (name, is_file, declared_size, open_member) in enumerate(iter_archive(archive, filename), 1):
+                if count > ARCHIVE_MAX_MEMBERS:
+                    raise ArchiveLimitError(f"Too many entries in {filename}, at most {ARCHIVE_MAX_MEMBERS}")
+                if not is_file or os.path.splitext(name)[1].lower() not in extensions:
+                    continue
+                if len(members) >= max_files:
+                    raise ArchiveLimitError(f"Too many files, at most {max_files} per request")
+                if declared_size > ARCHIVE_MAX_MEMBER_SIZE:
+                    raise ArchiveLimitError(f"{name} is larger than {ARCHIVE_MAX_MEMBER_SIZE} bytes")
+                if total_size + declared_size > ARCHIVE_MAX_TOTAL_SIZE:
+                    raise ArchiveLimitError(f"{filename} is larger than {ARCHIVE_MAX_TOTAL_SIZE} bytes after decompression")
+                with open_member() as member_file:
+                    tmp_path, digest, size = spool_member(member_file, name, ARCHIVE_MAX_TOTAL_SIZE - total_size)
+                members.append((name, tmp_path, digest))
+                total_size += size
+    except BaseException:
+        for _, tmp_path, _ in members:
+            os.remove(tmp_path)
+        raise
+    return members
@@ -0,0 +1,105 @@
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    线程安全的 LRU 缓存。
+    max_items 限制条目数，max_bytes（配合 sizeof）限制总大小，ttl 为过期秒数。
+    指定 disk_dir 时，写入的值同时以 JSON 保存到磁盘，内存淘汰或进程重启后仍可命中；
+    此时 key 必须可以作为文件名（例如哈希值的十六进制字符串）。
+    """
+
+    def __init__(self, max_items=1024, max_bytes=None, ttl=None, disk_dir=None, sizeof=len):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self.sizeof = sizeof
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def __len__(self):
+        return len(self._items)
+
+    def _expired(self, stored_at):
+        return self.ttl is not None and time.time() - stored_at > self.ttl
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key[:2], f'{key}.json')
+
+    def _read_disk(self, key):
+        try:
+            with open(self._disk_path(key), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if self._expired(entry['stored_at']):
+            return None
+        return entry
+
+    def _write_disk(self, key, value, stored_at):
+        path = self._disk_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先写临时文件再改名，避免其他进程读到写了一半的文件
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'stored_at': stored_at, 'value': value}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _put(self, key, value, stored_at):
+        if key in self._items:
+            self._bytes -= self._items.pop(key)[2]
+        size = self.sizeof(value) if self.max_bytes is not None else 0
+        self._items[key] = (value, stored_at, size)
+        self._bytes += size
+        while self._items and (len(self._items) > self.max_items or
+                               (self.max_bytes is not None and self._bytes > self.max_bytes)):
+            _, (_, _, evicted_size) = self._items.popitem(last=False)
+            self._bytes -= evicted_size
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and self._expired(item[1]):
+                self._bytes -= self._items.pop(key)[2]
+                item = None
+            if item is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return item[0]
+
+        entry = self._read_disk(key) if self.disk_dir else None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return default
+            self._put(key, entry['value'], entry['stored_at'])
+            self.hits += 1
+            return entry['value']
+
+    def set(self, key, value):
+        stored_at = time.time()
+        with self._lock:
+            self._put(key, value, stored_at)
+        if self.disk_dir:
+            self._write_disk(key, value, stored_at)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'items': len(self._items),
+                'bytes': self._bytes,
+            }
@@ -1,90 +1,262 @@
-import requests
+import os
+import time
+import asyncio
+import heapq
+import hashlib
+import threading
+import aiohttp
 import bs4
 import nltk
-from urllib.parse import urljoin
-from time import sleep
-import time
-import math
+import numpy as np
+from urllib.parse import urljoin, urlsplit, urlunsplit
+from services.cache import LRUCache
+
+# 爬取设置
+# 同时进行的请求数
+CRAWL_CONCURRENCY = int(os.environ.get('CRAWL_CONCURRENCY', 8))
+# 单次摘要最多抓取的页面数
+CRAWL_MAX_PAGES = int(os.environ.get('CRAWL_MAX_PAGES', 50))
+# 单次摘要的总时限（秒），到时返回已经完成的部分结果
+CRAWL_DEADLINE = float(os.environ.get('CRAWL_DEADLINE', 20))
+# 对同一站点两次请求之间的最小间隔（秒）
+CRAWL_HOST_INTERVAL = float(os.environ.get('CRAWL_HOST_INTERVAL', 1))
+# 单个请求的超时时间（秒）
+CRAWL_REQUEST_TIMEOUT = float(os.environ.get('CRAWL_REQUEST_TIMEOUT', 10))
+
+# 抓取缓存：FETCH_CACHE_TTL 秒内直接使用缓存，过期后带 If-None-Match/If-Modified-Since 重新验证
+FETCH_CACHE_TTL = float(os.environ.get('FETCH_CACHE_TTL', 300))
+FETCH_CACHE_MAX_BYTES = int(os.environ.get('FETCH_CACHE_MAX_BYTES', 64 * 1024 * 1024))
 
-# 全局变量来记录开始时间
-start_time = time.time()
+# IDF 表上限：词表超过 IDF_MAX_TERMS 时按文档频率从低到高淘汰，只保留 IDF_PRUNE_RATIO 比例的词，
+# 留出余量，避免每新增一个词就淘汰一次
+IDF_MAX_TERMS = int(os.environ.get('IDF_MAX_TERMS', 500000))
+IDF_PRUNE_RATIO = 0.9
 
-# 你可以设定一个最大运行时长，比如60秒
-max_run_time = 20
 
-# 添加一个简单的IDF计算器
-class SimpleIDFCalculator:
-    def __init__(self):
+# 跨请求共享的 IDF 表，每抓取一个页面增量更新一次
+class IDFTable:
+    def __init__(self, max_terms=IDF_MAX_TERMS):
         self.doc_freq = {}
         self.num_docs = 0
+        self.max_terms = max_terms
+        self._lock = threading.Lock()
+
+    def add_document(self, words):
+        with self._lock:
+            self.num_docs += 1
+            for word in set(words):
+                self.doc_freq[word] = self.doc_freq.get(word, 0) + 1
+            if len(self.doc_freq) > self.max_terms:
+                keep = int(self.max_terms * IDF_PRUNE_RATIO)
+                self.doc_freq = dict(heapq.nlargest(keep, self.doc_freq.items(), key=lambda item: item[1]))
+
+    def idf(self, words):
+        with self._lock:
+            doc_freq = np.fromiter((self.doc_freq.get(word, 0) for word in words),
+                                   dtype=np.float64, count=len(words))
+            num_docs = self.num_docs
+        return np.log(num_docs / (1 + doc_freq))
+
+
+idf_table = IDFTable()
+
+
+# 计算每个句子的 TF-IDF 得分：句子得分为句中每个词的 tf * idf 之和
+# tokenized_sentences 为 [(句子, 分词结果)]，每个句子只分词一次
+# 所有词先映射为整数 id，tf 和句子得分都用 bincount 一次算出，复杂度与文本长度成线性
+def score_sentences(tokenized_sentences, idf_table):
+    sentence_ids = {}
+    token_ids, token_sentences = [], []
+    vocab = {}
+    for sentence, tokens in tokenized_sentences:
+        if not tokens:
+            continue
+        sentence_id = sentence_ids.setdefault(sentence, len(sentence_ids))
+        for token in tokens:
+            token_ids.append(vocab.setdefault(token, len(vocab)))
+            token_sentences.append(sentence_id)
+    if not token_ids:
+        return {}
+
+    token_ids = np.array(token_ids)
+    tf = np.bincount(token_ids, minlength=len(vocab)) / len(token_ids)
+    idf = idf_table.idf(list(vocab))
+    scores = np.bincount(token_sentences, weights=(tf * idf)[token_ids], minlength=len(sentence_ids))
+    return dict(zip(sentence_ids, scores.tolist()))
+
+
+# 规范化 URL：协议和域名小写，去掉默认端口和 #fragment，空路径补为 /
+def normalize_url(url):
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+    if (scheme == 'http' and netloc.endswith(':80')) or (scheme == 'https' and netloc.endswith(':443')):
+        netloc = netloc.rsplit(':', 1)[0]
+    return urlunsplit((scheme, netloc, parts.path or '/', parts.query, ''))
+
+
+def _entry_size(entry):
+    return len(entry['title']) + len(entry['summary']) + sum(len(link) for link in entry['links']) + 256
+
+
+# 抓取缓存，键为规范化后的 URL，值为验证信息（ETag、Last-Modified、正文摘要值）和解析结果
+# 解析结果（标题、摘要、链接）随缓存保存，304 或正文未变化时不再解析
+fetch_cache = LRUCache(max_items=100000, max_bytes=FETCH_CACHE_MAX_BYTES, sizeof=_entry_size)
+
+
+# 按站点限速：同一 host 的两次请求至少间隔 interval 秒，不同 host 之间互不影响
+class HostRateLimiter:
+    def __init__(self, interval):
+        self.interval = interval
+        self._next_time = {}
+        self._locks = {}
+
+    async def wait(self, host):
+        lock = self._locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            loop = asyncio.get_running_loop()
+            now = loop.time()
+            next_time = self._next_time.get(host, now)
+            if next_time > now:
+                await asyncio.sleep(next_time - now)
+            self._next_time[host] = max(now, next_time) + self.interval
+
+
+# 解析网页并生成摘要，返回 (标题, 摘要, 页面中的链接)
+def summarize_page(url, html, idf_table=idf_table):
+    soup = bs4.BeautifulSoup(html, "html.parser")
+    title = soup.title.string if soup.title and soup.title.string else 'No Title'
+    text = soup.get_text().strip()
+    tokenized_sentences = [(sentence, nltk.word_tokenize(sentence)) for sentence in nltk.sent_tokenize(text)]
+    idf_table.add_document(word for _, tokens in tokenized_sentences for word in tokens)
+    scores = score_sentences(tokenized_sentences, idf_table)
+
+    summary = " ".join(sorted(scores, key=scores.get, reverse=True)[:10])
+    # Handle relative links
+    links = [urljoin(url, link.get("href")) for link in soup.find_all("a") if link.get("href")]
+    return title, summary, links
+
+
+class Crawler:
+    """
+    按层（BFS）并发抓取网页并生成摘要。
+    level 为 1 时只抓取起始页面，每多一层就继续抓取上一层页面中的链接。
+    """
+
+    def __init__(self, concurrency=CRAWL_CONCURRENCY, max_pages=CRAWL_MAX_PAGES,
+                 deadline=CRAWL_DEADLINE, host_interval=CRAWL_HOST_INTERVAL,
+                 request_timeout=CRAWL_REQUEST_TIMEOUT, idf_table=idf_table,
+                 cache=fetch_cache, cache_ttl=FETCH_CACHE_TTL):
+        self.concurrency = concurrency
+        self.max_pages = max_pages
+        self.deadline = deadline
+        self.host_interval = host_interval
+        self.request_timeout = request_timeout
+        self.idf_table = idf_table
+        self.cache = cache
+        self.cache_ttl = cache_ttl
+
+    async def _fetch(self, session, rate_limiter, semaphore, url, headers):
+        """返回 (状态码, 正文, 响应头)；非文本内容的正文为 None"""
+        # 先按站点限速再占用并发名额：等待同一站点的任务不会占满名额、拖住其他站点的请求
+        await rate_limiter.wait(urlsplit(url).netloc)
+        async with semaphore:
+            async with session.get(url, headers=headers) as response:
+                if response.status != 200:
+                    return response.status, None, response.headers
+                content_type = response.headers.get('Content-Type', 'text/html')
+                if not content_type.startswith('text/'):
+                    return response.status, None, response.headers
+                return response.status, await response.text(errors='replace'), response.headers
+
+    async def _load(self, session, rate_limiter, semaphore, url):
+        """返回页面的缓存条目，优先使用未过期的缓存，过期后做条件请求"""
+        entry = self.cache.get(url) if self.cache is not None else None
+        if entry is not None and time.time() - entry['fetched_at'] < self.cache_ttl:
+            return entry
+
+        headers = {}
+        if entry is not None:
+            if entry['etag']:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                headers['If-Modified-Since'] = entry['last_modified']
+        status, html, response_headers = await self._fetch(session, rate_limiter, semaphore, url, headers)
+
+        if status == 304 and entry is not None:
+            entry = dict(entry, fetched_at=time.time())
+        elif html is None:
+            return None
+        else:
+            digest = hashlib.sha256(html.encode('utf-8', errors='replace')).hexdigest()
+            if entry is None or entry['digest'] != digest:
+                # 解析和摘要是 CPU 密集的，放到线程池中执行，不阻塞其他请求
+                loop = asyncio.get_running_loop()
+                title, summary, links = await loop.run_in_executor(
+                    None, summarize_page, url, html, self.idf_table)
+                entry = {'title': title, 'summary': summary, 'links': links}
+            entry = dict(entry, digest=digest, fetched_at=time.time(),
+                         etag=response_headers.get('ETag'),
+                         last_modified=response_headers.get('Last-Modified'))
+
+        if self.cache is not None:
+            self.cache.set(url, entry)
+        return entry
+
+    async def _process(self, session, rate_limiter, semaphore, url, results):
+        try:
+            entry = await self._load(session, rate_limiter, semaphore, url)
+            if entry is None:
+                return []
+            results[url] = (url, entry['title'], entry['summary'])
+            return entry['links']
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Error processing {url}: {e}")
+            return []
 
-    def add_document(self, doc):
-        self.num_docs += 1
-        words = set(nltk.word_tokenize(doc))
-        for word in words:
-            if word in self.doc_freq:
-                self.doc_freq[word] += 1
-            else:
-                self.doc_freq[word] = 1
+    async def _crawl(self, url, level, results, order):
+        rate_limiter = HostRateLimiter(self.host_interval)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        timeout = aiohttp.ClientTimeout(total=self.request_timeout)
 
-    def idf(self, word):
-        return math.log(self.num_docs / (1 + self.doc_freq.get(word, 0)))
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            url = normalize_url(url)
+            frontier = [url] if url.startswith("http") else []
+            order[url] = 0
+            for depth in range(level):
+                if not frontier:
+                    break
+                link_lists = await asyncio.gather(*[
+                    self._process(session, rate_limiter, semaphore, page_url, results)
+                    for page_url in frontier
+                ])
+                if depth == level - 1:
+                    break
+                frontier = []
+                for links in link_lists:
+                    for next_url in map(normalize_url, links):
+                        if len(order) >= self.max_pages:
+                            break
+                        if next_url in order or not next_url.startswith("http"):
+                            continue
+                        order[next_url] = len(order)
+                        frontier.append(next_url)
 
+    async def crawl(self, url, level):
+        """返回 [(url, 标题, 摘要)]，按发现顺序排列；超过总时限时返回已完成的部分"""
+        results = {}
+        order = {}
+        if level > 0:
+            try:
+                await asyncio.wait_for(self._crawl(url, level, results, order), self.deadline)
+            except asyncio.TimeoutError:
+                print(f"Reached deadline of {self.deadline}s, returning {len(results)} pages")
+        return sorted(results.values(), key=lambda item: order[item[0]])
 
 
 # 定义一个函数，用于获取网页的内容，并进行总结
-def get_summary(url, level):
-    result = []
-    visited = set()
-    idf_calculator = SimpleIDFCalculator()
-    helper(url, level, result, visited, idf_calculator)
-    return result
-
-# 辅助函数
-def helper(url, level, result, visited, idf_calculator):
-    # # 检查是否超出运行时间限制
-    # if time.time() - start_time > max_run_time:
-    #     print("Reached max run time, exiting...")
-    #     return
-    
-    if level == 0 or url in visited or not url.startswith("http"):
-        return
-
-    visited.add(url)
-    try:
-        response = requests.get(url)
-        if response.status_code != 200:
-            return
-        soup = bs4.BeautifulSoup(response.text, "html.parser")
-        title = soup.title.string if soup.title else 'No Title'
-        text = soup.get_text().strip()
-        idf_calculator.add_document(text)
-        sentences = nltk.sent_tokenize(text)
-        words = nltk.word_tokenize(text)
-
-        scores = {}
-        for sentence in sentences:
-            for word in nltk.word_tokenize(sentence):
-                tf = words.count(word) / len(words)
-                idf = idf_calculator.idf(word)
-                scores[sentence] = scores.get(sentence, 0) + (tf * idf)
-
-        summary = " ".join(sorted(scores, key=scores.get, reverse=True)[:10])
-        result.append((url, title, summary))
-
-        sleep(1)  # Simple delay to prevent aggressive crawling
-
-        links = soup.find_all("a")
-        for link in links:
-            href = link.get("href")
-            if href:
-                # Handle relative links
-                next_url = urljoin(url, href)
-                helper(next_url, level - 1, result, visited, idf_calculator)
-
-    except Exception as e:
-        print(f"Error processing {url}: {e}")
-
-# # 主程序部分，仅作为函数调用示例：
-# summary = get_summary('https://zhihu.com', 2)
-# print(summary)
+async def get_summary(url, level):
+    return await Crawler().crawl(url, level)
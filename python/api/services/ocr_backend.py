@@ -0,0 +1,109 @@
+import os
+import sys
+import threading
+from io import BytesIO
+
+
+# OCR 后端：baidu（百度 OCR API）或 deepdoc（本地 ONNX 模型）
+OCR_BACKEND = os.environ.get('OCR_BACKEND', 'baidu')
+
+# 百度OCR API设置
+APP_ID = os.environ.get('APP_ID','xxx')
+API_KEY = os.environ.get('API_KEY','xxx')
+SECRET_KEY = os.environ.get('SECRET_KEY','xxx')
+
+# deepdoc 设置：DEEPDOC_PATH 为 deepdoc/vision 目录，DEEPDOC_MODEL_DIR 为模型目录，
+# 不设置模型目录时由 deepdoc 自行从 HuggingFace 下载
+DEEPDOC_PATH = os.environ.get('DEEPDOC_PATH', os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..', '..', 'deepdoc', 'vision')))
+DEEPDOC_MODEL_DIR = os.environ.get('DEEPDOC_MODEL_DIR')
+
+
+class BaiduOCRBackend:
+    """百度通用文字识别，每张图片一次网络请求"""
+
+    # 不支持批量识别：调用方应并发提交单张图片
+    batches = False
+
+    def __init__(self):
+        from aip import AipOcr
+        self.client = AipOcr(APP_ID, API_KEY, SECRET_KEY)
+
+    # 接口返回错误（QPS 超限、鉴权失败等）时返回 None，调用方不应缓存这个结果
+    def recognize(self, image_data):
+        result = self.client.basicGeneral(image_data)
+        if 'error_code' in result or 'words_result' not in result:
+            return None
+        text = ''
+        for item in result['words_result']:
+            text += item['words'] + '\n'
+        return text
+
+    def recognize_batch(self, images):
+        return [self.recognize(image_data) for image_data in images]
+
+
+class DeepDocOCRBackend:
+    """
+    进程内的 deepdoc OCR。
+    一批图片的文本检测按 DEEPDOC_DET_BATCH_SIZE 张一组批量进行，再把所有文本框一起送入识别模型。
+    """
+
+    # 支持批量识别：调用方应把一批图片一次交给 recognize_batch
+    batches = True
+
+    def __init__(self, model_dir=DEEPDOC_MODEL_DIR):
+        # deepdoc 的模块按 deepdoc/vision 为根目录导入
+        if DEEPDOC_PATH not in sys.path:
+            sys.path.insert(0, DEEPDOC_PATH)
+        from ocr import OCR
+        self.ocr = OCR(model_dir)
+
+    def _load_image(self, image_data):
+        import numpy as np
+        from PIL import Image
+        return np.array(Image.open(BytesIO(image_data)).convert('RGB'))
+
+    def recognize(self, image_data):
+        return self.recognize_batch([image_data])[0]
+
+    def recognize_batch(self, images):
+        crops, owners = [], []
+        imgs = [self._load_image(image_data) for image_data in images]
+        batch_boxes, _ = self.ocr.text_detector.detect_batch(imgs)
+        for index, (img, dt_boxes) in enumerate(zip(imgs, batch_boxes)):
+            if dt_boxes is None or len(dt_boxes) == 0:
+                continue
+            for box in self.ocr.sorted_boxes(dt_boxes):
+                crops.append(self.ocr.get_rotate_crop_image(img, box.copy()))
+                owners.append(index)
+
+        texts = [''] * len(images)
+        if not crops:
+            return texts
+        rec_res, _ = self.ocr.text_recognizer(crops)
+        for index, (text, score) in zip(owners, rec_res):
+            if score >= self.ocr.drop_score and text:
+                texts[index] += text + '\n'
+        return texts
+
+
+OCR_BACKENDS = {
+    'baidu': BaiduOCRBackend,
+    'deepdoc': DeepDocOCRBackend,
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+# 每个工作进程只创建一次 OCR 后端（deepdoc 模型加载较慢）
+def get_ocr_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if OCR_BACKEND not in OCR_BACKENDS:
+                    raise ValueError(f'Unsupported OCR backend: {OCR_BACKEND}')
+                _backend = OCR_BACKENDS[OCR_BACKEND]()
+    return _backend
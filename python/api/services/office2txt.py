@@ -1,93 +1,272 @@
 import os
 import docx
-from aip import AipOcr
-from io import BytesIO
+import fitz
+import hashlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from PyPDF2 import PdfReader
-from pdf2image import convert_from_path
+from services.cache import LRUCache
+from services.ocr_backend import get_ocr_backend, OCR_BACKEND
 
+# 提取器版本：提取逻辑或输出格式变化时递增，使已缓存的提取结果失效
+EXTRACTOR_VERSION = 2
 
-# 百度OCR API设置
-APP_ID = os.environ.get('APP_ID','xxx')
-API_KEY = os.environ.get('API_KEY','xxx')
-SECRET_KEY = os.environ.get('SECRET_KEY','xxx')
+# PDF OCR 控制：某页直接提取出的文字不少于 PDF_TEXT_THRESHOLD 个字符时，跳过该页的栅格化和 OCR
+PDF_TEXT_THRESHOLD = int(os.environ.get('PDF_TEXT_THRESHOLD', 100))
+# 同时进行的 OCR 请求数
+OCR_CONCURRENCY = int(os.environ.get('OCR_CONCURRENCY', 4))
+# PDF 每组处理的页数：文字提取、栅格化和 OCR 都按组进行，流式输出时第一组页面处理完即可返回
+PDF_RASTER_BATCH = int(os.environ.get('PDF_RASTER_BATCH', 8))
+# 栅格化的分辨率
+PDF_RASTER_DPI = int(os.environ.get('PDF_RASTER_DPI', 200))
+# docx 中每攒够多少张图片做一次批量 OCR
+DOC_OCR_BATCH = int(os.environ.get('DOC_OCR_BATCH', 16))
+# 影响提取结果的设置，作为结果缓存键的一部分：切换 OCR 后端或调整阈值、分辨率后不会命中旧的结果
+EXTRACTOR_SETTINGS = f'{OCR_BACKEND}-t{PDF_TEXT_THRESHOLD}-d{PDF_RASTER_DPI}'
 
+# OCR 结果缓存：以图片内容的 SHA-256 为键，重复出现的图片（logo、印章等）只识别一次
+# 设置 OCR_CACHE_DIR 后结果同时保存到磁盘，可在多个工作进程和重启之间共享
+OCR_CACHE_SIZE = int(os.environ.get('OCR_CACHE_SIZE', 4096))
+OCR_CACHE_DIR = os.environ.get('OCR_CACHE_DIR')
 
 
-client = AipOcr(APP_ID, API_KEY, SECRET_KEY)
+ocr_cache = LRUCache(max_items=OCR_CACHE_SIZE, disk_dir=OCR_CACHE_DIR)
 
 def ocr_image(image_data):
-    result = client.basicGeneral(image_data)
-    text = ''
-    if 'words_result' in result:
-        for item in result['words_result']:
-            text += item['words'] + '\n'
-    return text
+    return ocr_images([image_data])[0]
 
-def process_pdf(file_path):
-    pdf = PdfReader(file_path)
-    num_pages = len(pdf.pages)
-    text = ''
-    for page_num in range(num_pages):
-        page = pdf.pages[page_num]
-        text += f'--------------------------------------------\n'
-        text += f'文档名：{os.path.basename(file_path)}\n'
-        text += f'页数：{page_num + 1}\n'
-        text += f'该页内容：\n'
-        text += page.extract_text() + '\n'
-        images = convert_from_path(file_path, first_page=page_num + 1, last_page=page_num + 1)
-        for image in images:
-            image_data = BytesIO()
-            image.save(image_data, format='PNG')
-            image_data = image_data.getvalue()
-            ocr_text = ocr_image(image_data)
-            if ocr_text:
-                text += f'图片文字：\n'
-                text += ocr_text + '\n'
-        text += '--------------------------------------------\n'
-    return text
+# 批量 OCR：先查缓存，未命中的图片（相同内容只保留一份）一次性交给 OCR 后端
+# 后端识别失败的图片结果为 None，不写入缓存，下次请求时重新识别
+def ocr_images(images):
+    keys = [hashlib.sha256(image_data).hexdigest() for image_data in images]
+    texts = [ocr_cache.get(key) for key in keys]
+    missing = {}
+    for key, image_data, text in zip(keys, images, texts):
+        if text is None:
+            missing.setdefault(key, image_data)
+
+    if missing:
+        results = dict(zip(missing, get_ocr_backend().recognize_batch(list(missing.values()))))
+        for key, text in results.items():
+            if text is not None:
+                ocr_cache.set(key, text)
+        texts = [results[key] if text is None else text for key, text in zip(keys, texts)]
+    return texts
+
+# 文件来源 source 为暂存的临时文件路径，filename 为上传时的文件名
+def source_name(source, filename=None):
+    return os.path.basename(filename or source)
+
+# 在进程内用 fitz 栅格化任意一组页面（页码从 1 开始），返回 PNG 内容列表，不启动外部进程
+def rasterize_pdf_pages(source, page_nums, dpi=PDF_RASTER_DPI):
+    with fitz.open(source) as pdf:
+        return [pdf[page_num - 1].get_pixmap(dpi=dpi).tobytes('png') for page_num in page_nums]
+
+# 等待所在批次栅格化完成后识别其中一页，识别后释放该页的图片（用于不支持批量识别的后端）
+def ocr_rasterized_page(raster_future, index):
+    images = raster_future.result()
+    image_data, images[index] = images[index], None
+    return ocr_image(image_data)
+
+# 等待批次栅格化完成后一次识别整批页面，返回按页排列的文字（用于支持批量识别的后端）
+def ocr_rasterized_batch(raster_future):
+    return ocr_images(raster_future.result())
+
+# 逐页生成 PDF 内容块
+# 页面按 PDF_RASTER_BATCH 页一组处理：提取一组页面的文字，已有足够文字的页面跳过栅格化，
+# 其余页面在后台栅格化并 OCR。输出当前一组之前先提交下一组，内存中最多保留两组页面，
+# 第一块的等待时间与总页数无关
+# 后端支持批量识别时每组页面一次送入 OCR，否则逐页并发识别
+# 栅格化只用一个线程：同一个 fitz 文档不能在多个线程中同时使用
+def iter_pdf_blocks(source, filename=None):
+    pdf = PdfReader(source)
+    name = source_name(source, filename)
+    page_count = len(pdf.pages)
+
+    with ThreadPoolExecutor(max_workers=1) as rasterizer, \
+            ThreadPoolExecutor(max_workers=OCR_CONCURRENCY) as executor:
+
+        # 提交从 first 开始的一组页面，返回 ([(页码, 文字)], {页码: (OCR 任务, 该页在批次结果中的位置)}, 任务列表)
+        # 逐页识别时位置为 None
+        def submit_window(first):
+            page_nums = range(first, min(first + PDF_RASTER_BATCH, page_count + 1))
+            pages = [(page_num, pdf.pages[page_num - 1].extract_text()) for page_num in page_nums]
+            ocr_pages = [page_num for page_num, page_text in pages if len(page_text.strip()) < PDF_TEXT_THRESHOLD]
+            ocr_futures, futures = {}, []
+            if ocr_pages:
+                raster_future = rasterizer.submit(rasterize_pdf_pages, source, ocr_pages)
+                futures.append(raster_future)
+                if get_ocr_backend().batches:
+                    batch_future = executor.submit(ocr_rasterized_batch, raster_future)
+                    futures.append(batch_future)
+                    for index, page_num in enumerate(ocr_pages):
+                        ocr_futures[page_num] = (batch_future, index)
+                else:
+                    for index, page_num in enumerate(ocr_pages):
+                        ocr_future = executor.submit(ocr_rasterized_page, raster_future, index)
+                        futures.append(ocr_future)
+                        ocr_futures[page_num] = (ocr_future, None)
+            return pages, ocr_futures, futures
+
+        def window_blocks(window):
+            pages, ocr_futures, _ = window
+            for page_num, page_text in pages:
+                block = {'document': name, 'page': page_num, 'text': page_text, 'ocr_text': None}
+                if page_num in ocr_futures:
+                    ocr_future, index = ocr_futures[page_num]
+                    block['ocr_text'] = ocr_future.result() if index is None else ocr_future.result()[index]
+                    if block['ocr_text'] is None:
+                        block['ocr_failed'] = True
+                yield block
+
+        windows = deque()
+        try:
+            for first in range(1, page_count + 1, PDF_RASTER_BATCH):
+                windows.append(submit_window(first))
+                if len(windows) > 1:
+                    yield from window_blocks(windows[0])
+                    windows.popleft()
+            while windows:
+                yield from window_blocks(windows[0])
+                windows.popleft()
+        finally:
+            # 调用方提前停止读取时，放弃尚未开始的栅格化和 OCR
+            for _, _, futures in windows:
+                for future in futures:
+                    future.cancel()
+
+def format_pdf_block(block):
+    parts = [
+        '--------------------------------------------\n',
+        f'文档名：{block["document"]}\n',
+        f'页数：{block["page"]}\n',
+        '该页内容：\n',
+        block['text'] + '\n',
+    ]
+    if block['ocr_text']:
+        parts.append('图片文字：\n')
+        parts.append(block['ocr_text'] + '\n')
+    parts.append('--------------------------------------------\n')
+    return ''.join(parts)
+
+def process_pdf(source, filename=None):
+    return ''.join(format_pdf_block(block) for block in iter_pdf_blocks(source, filename))
 
-def process_doc(file_path):
-    doc = docx.Document(file_path)
-    text = ''
+# 逐段生成 docx 内容块，空段落视为分页符
+# 图片按段落收集，攒够 DOC_OCR_BATCH 张后批量 OCR，再输出这些段落
+def iter_doc_blocks(source, filename=None):
+    doc = docx.Document(source)
+    name = source_name(source, filename)
     page_num = 1
+    pending = []
+    images = []
+
+    def flush():
+        ocr_texts = ocr_images(images) if images else []
+        for block, image_indexes in pending:
+            block['ocr_text'] = '\n'.join(ocr_texts[i] for i in image_indexes if ocr_texts[i]) or None
+            if any(ocr_texts[i] is None for i in image_indexes):
+                block['ocr_failed'] = True
+            if block['text'].strip() or block['ocr_text'] or block.get('ocr_failed'):
+                yield block
+        pending.clear()
+        images.clear()
+
     for paragraph in doc.paragraphs:
         if paragraph.text.strip() == '':  # 简单地将空行视为分页符
             page_num += 1
-        else:
-            text += f'--------------------------------------------\n'
-            text += f'文档名：{os.path.basename(file_path)}\n'
-            text += f'页数：{page_num}\n'
-            text += f'该页内容：\n'
-            text += paragraph.text + '\n'
-
-        for shape in doc.inline_shapes:
-            if shape.type == docx.enum.shape.WD_INLINE_SHAPE.PICTURE:
-                blip_id = shape._inline.graphic.graphicData.pic.blipFill.blip.embed
-                image_part = doc.part.related_parts[blip_id]
-                image_data = image_part.blob
-                ocr_text = ocr_image(image_data)
-                if ocr_text:
-                    text += f'图片文字：\n'
-                    text += ocr_text + '\n'
+        image_indexes = []
+        for blip_id in paragraph._element.xpath('.//pic:pic/pic:blipFill/a:blip/@r:embed'):
+            image_part = doc.part.related_parts.get(blip_id)
+            if image_part is not None:
+                image_indexes.append(len(images))
+                images.append(image_part.blob)
+        pending.append(({'document': name, 'page': page_num, 'text': paragraph.text}, image_indexes))
+        if len(images) >= DOC_OCR_BATCH or not images:
+            yield from flush()
+    yield from flush()
 
-    return text
+def format_doc_block(block):
+    parts = []
+    if block['text'].strip():
+        parts.append('--------------------------------------------\n')
+        parts.append(f'文档名：{block["document"]}\n')
+        parts.append(f'页数：{block["page"]}\n')
+        parts.append('该页内容：\n')
+        parts.append(block['text'] + '\n')
+    if block['ocr_text']:
+        parts.append('图片文字：\n')
+        parts.append(block['ocr_text'] + '\n')
+    return ''.join(parts)
+
+def process_doc(source, filename=None):
+    return ''.join(format_doc_block(block) for block in iter_doc_blocks(source, filename))
 
-def process_txt(file_path):
-    with open(file_path, 'r', encoding='utf-8') as f:
+# 逐段生成 txt 内容块，空行视为分页符
+def iter_txt_blocks(source, filename=None):
+    name = source_name(source, filename)
+    page_num = 1
+    lines = []
+    with open(source, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip() == '':
+                if lines:
+                    yield {'document': name, 'page': page_num, 'text': ''.join(lines), 'ocr_text': None}
+                    lines = []
+                page_num += 1
+            else:
+                lines.append(line)
+    if lines:
+        yield {'document': name, 'page': page_num, 'text': ''.join(lines), 'ocr_text': None}
+
+def process_txt(source, filename=None):
+    with open(source, 'r', encoding='utf-8') as f:
         text = f.read()
     return text
 
-def office_to_txt(file_path):
-    file_ext = os.path.splitext(file_path)[1].lower()
+BLOCK_EXTRACTORS = {
+    '.docx': iter_doc_blocks,
+    '.pdf': iter_pdf_blocks,
+    '.doc': iter_doc_blocks,
+    '.txt': iter_txt_blocks,
+}
+
+BLOCK_FORMATTERS = {
+    '.docx': format_doc_block,
+    '.pdf': format_pdf_block,
+    '.doc': format_doc_block,
+}
+
+# 逐块提取文件内容，每块为 {'document', 'page', 'text', 'ocr_text'}，用于流式输出
+# OCR 后端出错时该块另有 'ocr_failed': True，ocr_text 中缺少出错图片的文字
+def iter_office_blocks(source, filename=None):
+    file_ext = os.path.splitext(filename or source)[1].lower()
+    if file_ext not in BLOCK_EXTRACTORS:
+        raise ValueError('Unsupported file format')
+    return BLOCK_EXTRACTORS[file_ext](source, filename)
+
+def extract_blocks(source, filename=None):
+    return list(iter_office_blocks(source, filename))
+
+# 把内容块拼成与 office_to_txt 相同的文本（txt 文件不经过内容块，直接读取原文）
+def format_blocks(blocks, filename):
+    file_ext = os.path.splitext(filename)[1].lower()
+    if file_ext not in BLOCK_FORMATTERS:
+        raise ValueError('Unsupported file format')
+    formatter = BLOCK_FORMATTERS[file_ext]
+    return ''.join(formatter(block) for block in blocks)
+
+# source 为文件路径，filename 用于判断格式和输出文档名
+def office_to_txt(source, filename=None):
+    file_ext = os.path.splitext(filename or source)[1].lower()
     if file_ext == '.docx':
-        return process_doc(file_path)
+        return process_doc(source, filename)
     elif file_ext == '.pdf':
-        return process_pdf(file_path)
+        return process_pdf(source, filename)
     elif file_ext == '.doc':
-        return process_doc(file_path)
+        return process_doc(source, filename)
     elif file_ext == '.txt':
-        return process_txt(file_path)
+        return process_txt(source, filename)
     
     else:
         raise ValueError('Unsupported file format')
-    
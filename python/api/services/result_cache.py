@@ -0,0 +1,119 @@
+import os
+import asyncio
+from services.cache import LRUCache
+
+
+# 提取结果缓存设置
+RESULT_CACHE_SIZE = int(os.environ.get('RESULT_CACHE_SIZE', 256))
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('RESULT_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+RESULT_CACHE_DIR = os.environ.get('RESULT_CACHE_DIR')
+# 提取结果的有效期（秒），不设置时不过期
+RESULT_CACHE_TTL = float(os.environ['RESULT_CACHE_TTL']) if os.environ.get('RESULT_CACHE_TTL') else None
+
+
+def _blocks_size(blocks):
+    return sum(len(block['text']) + len(block['ocr_text'] or '') for block in blocks)
+
+
+def _complete(blocks):
+    # OCR 后端出错（QPS 超限、鉴权失败等）的块带有 ocr_failed 标记，这样的结果不缓存，下次请求时重新提取
+    return not any(block.get('ocr_failed') for block in blocks)
+
+
+def result_key(digest, file_ext, version, settings=''):
+    """缓存键：文件内容的 SHA-256 + 文件格式 + 提取器版本 + 影响结果的设置（OCR 后端等）"""
+    key = f'{digest}-{file_ext.lstrip(".")}-v{version}'
+    return f'{key}-{settings}' if settings else key
+
+
+class ResultCache:
+    """
+    提取结果（内容块列表）的缓存。
+    内存中为有界 LRU，设置 disk_dir 后同时保存到磁盘；
+    相同内容的并发请求合并到同一个正在执行的任务上，只提取一次；
+    等待正在执行的任务最多 wait_timeout 秒（None 表示不限）。
+    """
+
+    def __init__(self, max_items=RESULT_CACHE_SIZE, max_bytes=RESULT_CACHE_MAX_BYTES, disk_dir=RESULT_CACHE_DIR,
+                 ttl=RESULT_CACHE_TTL, wait_timeout=None):
+        self.cache = LRUCache(max_items=max_items, max_bytes=max_bytes, ttl=ttl, disk_dir=disk_dir,
+                              sizeof=_blocks_size)
+        self.wait_timeout = wait_timeout
+        self.coalesced = 0
+        self._inflight = {}
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    async def aget(self, key):
+        """在事件循环中使用的 get：有磁盘层时在线程池中读取，不阻塞其他请求"""
+        if self.cache.disk_dir is None:
+            return self.get(key)
+        return await asyncio.get_running_loop().run_in_executor(None, self.get, key)
+
+    def inflight(self, key):
+        return self._inflight.get(key)
+
+    def start(self, key):
+        """登记一个正在执行的任务，相同 key 的后续请求可以等待它的结果"""
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        return future
+
+    def finish(self, key, blocks):
+        future = self._inflight.get(key)
+        if future is not None and not future.done():
+            future.set_result(blocks)
+        # 已在等待的请求仍然得到这次的结果，但不完整的结果不缓存
+        if not _complete(blocks):
+            self._inflight.pop(key, None)
+            return
+        if self.cache.disk_dir is None:
+            self.cache.set(key, blocks)
+            self._inflight.pop(key, None)
+            return
+        # 写磁盘在线程池中进行；写完之前，相同 key 的新请求仍然从已完成的任务取得结果
+        write = asyncio.get_running_loop().run_in_executor(None, self.cache.set, key, blocks)
+        write.add_done_callback(lambda write: self._written(key, future, write))
+
+    def _written(self, key, future, write):
+        if key in self._inflight and self._inflight[key] is future:
+            del self._inflight[key]
+        if not write.cancelled() and write.exception() is not None:
+            print(f"Failed to write result cache {key}: {write.exception()}")
+
+    def abort(self, key, error):
+        future = self._inflight.pop(key, None)
+        if future is not None and not future.done():
+            future.set_exception(error)
+            # 没有其他请求在等待时，避免 "exception was never retrieved" 警告
+            future.exception()
+
+    async def wait(self, future):
+        """等待相同 key 的正在执行的任务，超过 wait_timeout 秒时抛出 TimeoutError"""
+        self.coalesced += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), self.wait_timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f'Waiting for the same extraction exceeded {self.wait_timeout}s')
+
+    async def get_or_run(self, key, run):
+        """命中缓存时直接返回；已有相同任务在执行时等待它；否则执行 run() 并缓存结果"""
+        blocks = await self.aget(key)
+        if blocks is not None:
+            return blocks
+        future = self.inflight(key)
+        if future is not None:
+            return await self.wait(future)
+
+        self.start(key)
+        try:
+            blocks = await run()
+        except BaseException as e:
+            self.abort(key, e if isinstance(e, Exception) else RuntimeError('Extraction cancelled'))
+            raise
+        self.finish(key, blocks)
+        return blocks
+
+    def stats(self):
+        return dict(self.cache.stats(), coalesced=self.coalesced, inflight=len(self._inflight))
@@ -0,0 +1,306 @@
+import os
+import queue
+import signal
+import asyncio
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+
+# 提取任务调度设置
+EXTRACT_WORKERS = int(os.environ.get('EXTRACT_WORKERS', os.cpu_count() or 1))
+EXTRACT_QUEUE_SIZE = int(os.environ.get('EXTRACT_QUEUE_SIZE', 32))
+EXTRACT_TIMEOUT = float(os.environ.get('EXTRACT_TIMEOUT', 300))
+EXTRACT_RETRY_AFTER = int(os.environ.get('EXTRACT_RETRY_AFTER', 5))
+# 工作进程到达时限后自行中止任务；超过时限 EXTRACT_KILL_GRACE 秒仍未结束时重建进程池
+EXTRACT_KILL_GRACE = float(os.environ.get('EXTRACT_KILL_GRACE', 5))
+# 流式任务在子进程和主进程之间缓冲的最大结果数
+STREAM_BUFFER_SIZE = int(os.environ.get('STREAM_BUFFER_SIZE', 8))
+
+_ITEM, _ERROR, _DONE = 'item', 'error', 'done'
+# 工作进程等待结果队列空位时检查取消标记的间隔（秒）
+_PUT_INTERVAL = 0.5
+
+
+class QueueFullError(Exception):
+    """等待队列已满，调用方应稍后重试"""
+
+    def __init__(self, retry_after):
+        super().__init__('Extraction queue is full')
+        self.retry_after = retry_after
+
+
+class JobTimeoutError(Exception):
+    """任务超过了单任务时限"""
+
+
+def _on_deadline(signum, frame):
+    raise JobTimeoutError('Job exceeded its deadline')
+
+
+# 在子进程中执行任务，到达时限时由 SIGALRM 中断任务，释放工作进程
+# 进程池的任务在子进程主线程中执行，可以使用信号；不支持 setitimer 的平台上不设时限
+def _run_with_deadline(timeout, fn, args):
+    if not hasattr(signal, 'setitimer') or timeout is None:
+        return fn(*args)
+    previous = signal.signal(signal.SIGALRM, _on_deadline)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return fn(*args)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+# 把一条结果放入有界队列；队列已满时每隔 _PUT_INTERVAL 秒检查一次取消标记
+# 返回 False 表示消费方已经离开
+def _put(results, cancelled, message):
+    while not cancelled.is_set():
+        try:
+            results.put(message, timeout=_PUT_INTERVAL)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+# 在子进程中运行生成器函数，把结果逐个放入队列
+# 每产出一块前检查取消标记：消费方断开后工作进程在 _PUT_INTERVAL 秒内放弃任务
+def _pump(fn, args, results, cancelled):
+    try:
+        for item in fn(*args):
+            if not _put(results, cancelled, (_ITEM, item)):
+                return
+    except Exception as e:
+        _put(results, cancelled, (_ERROR, e))
+        return
+    _put(results, cancelled, (_DONE, None))
+
+
+# 通知工作进程停止，并清空队列，唤醒正在等待空位的 put
+def _cancel_stream(results, cancelled):
+    try:
+        cancelled.set()
+        while True:
+            results.get_nowait()
+    except queue.Empty:
+        pass
+    except (OSError, EOFError):
+        # Manager 已随服务退出关闭
+        pass
+
+
+class _ResultStream:
+    """
+    JobScheduler.stream 返回的异步迭代器。
+    与普通的异步生成器不同，还没有开始迭代时调用 aclose() 也会停止工作进程中的任务并归还名额
+    """
+
+    def __init__(self, scheduler, future, results, cancelled):
+        self._scheduler = scheduler
+        self._future = future
+        self._results = results
+        self._cancelled = cancelled
+        self._closed = False
+        self._iterator = self._iterate()
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        return self._iterator.__anext__()
+
+    async def aclose(self):
+        await self._iterator.aclose()
+        self._close()
+
+    def _close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if not self._future.done():
+            _cancel_stream(self._results, self._cancelled)
+        self._scheduler._stop(self._future)
+
+    async def _iterate(self):
+        loop = asyncio.get_running_loop()
+        poller = self._scheduler._get_poller()
+        timeout = self._scheduler.timeout
+        deadline = loop.time() + timeout
+        try:
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise JobTimeoutError(f'Job exceeded {timeout}s')
+                try:
+                    kind, item = await loop.run_in_executor(poller, self._results.get, True, min(remaining, 1))
+                except queue.Empty:
+                    if self._future.done():
+                        # 子进程异常退出，没有发出结束标记
+                        self._future.result()
+                        return
+                    continue
+                if kind == _ITEM:
+                    yield item
+                elif kind == _ERROR:
+                    raise item
+                else:
+                    return
+        finally:
+            self._close()
+
+
+class JobScheduler:
+    """
+    CPU 密集型任务的进程池调度器。
+    同时运行的任务数为 max_workers，另有 max_queue 个任务可以排队等待，
+    超出部分直接拒绝（QueueFullError），而不是在事件循环上无限堆积。
+    """
+
+    def __init__(self, max_workers=EXTRACT_WORKERS, max_queue=EXTRACT_QUEUE_SIZE,
+                 timeout=EXTRACT_TIMEOUT, retry_after=EXTRACT_RETRY_AFTER, kill_grace=EXTRACT_KILL_GRACE):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.kill_grace = kill_grace
+        self._executor = None
+        self._manager = None
+        self._poller = None
+        self._pending = 0
+        self._waiters = deque()
+        self._reapers = set()
+
+    @property
+    def capacity(self):
+        return self.max_workers + self.max_queue
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def _get_executor(self):
+        # 进程池在第一次提交任务时才创建，避免 import 时就拉起子进程
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    def _recycle(self):
+        # 卡在 C 扩展或不可中断调用中的任务收不到 SIGALRM，只能结束整个进程池；
+        # 池中其他任务会以 BrokenProcessPool 失败并归还名额，后续任务使用新的进程池
+        executor, self._executor = self._executor, None
+        if executor is None:
+            return
+        for process in list(executor._processes.values()):
+            process.terminate()
+        executor.shutdown(wait=False)
+
+    async def _reap(self, future):
+        # 任务可能在排队一段时间后才开始执行，子进程中的时限从开始执行时计算，
+        # 因此最多再等 timeout + kill_grace 秒
+        try:
+            await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), self.timeout + self.kill_grace)
+        except asyncio.TimeoutError:
+            self._recycle()
+        except BaseException:
+            pass
+
+    def _stop(self, future):
+        """调用方已放弃的任务：未开始的直接取消，正在执行的在后台等待它中止"""
+        if future.cancel() or future.done():
+            return
+        task = asyncio.ensure_future(self._reap(future))
+        self._reapers.add(task)
+        task.add_done_callback(self._reapers.discard)
+
+    def _get_poller(self):
+        # 流式任务在线程中阻塞等待结果队列，使用独立的线程池，不占用事件循环的默认线程池；
+        # 同时执行的流式任务不超过 capacity 个，每个最多占用一个线程
+        if self._poller is None:
+            self._poller = ThreadPoolExecutor(max_workers=self.capacity, thread_name_prefix='stream-poll')
+        return self._poller
+
+    def _get_manager(self):
+        # 跨进程的结果队列由 Manager 提供，可以作为参数传给进程池中的任务
+        if self._manager is None:
+            self._manager = multiprocessing.Manager()
+        return self._manager
+
+    def _release(self, _future=None):
+        self._pending -= 1
+        # 唤醒一个等待名额的任务
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                break
+
+    async def _wait_for_slot(self):
+        loop = asyncio.get_running_loop()
+        while self._pending >= self.capacity:
+            waiter = loop.create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+
+    def _release_threadsafe(self, loop):
+        def callback(future):
+            try:
+                loop.call_soon_threadsafe(self._release, future)
+            except RuntimeError:
+                # 事件循环已关闭（服务退出中），无需再归还名额
+                pass
+        return callback
+
+    def _start(self, fn, *args):
+        if self._pending >= self.capacity:
+            raise QueueFullError(self.retry_after)
+
+        loop = asyncio.get_running_loop()
+        self._pending += 1
+        try:
+            future = self._get_executor().submit(_run_with_deadline, self.timeout, fn, args)
+        except Exception:
+            self._release()
+            raise
+        # 名额在子进程真正结束后才释放
+        future.add_done_callback(self._release_threadsafe(loop))
+        return future
+
+    async def submit(self, fn, *args, wait=False):
+        """wait 为 True 时队列已满会等待空出名额，而不是抛出 QueueFullError（用于批量任务）"""
+        if wait:
+            await self._wait_for_slot()
+        future = self._start(fn, *args)
+        try:
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), self.timeout)
+        except asyncio.TimeoutError:
+            self._stop(future)
+            raise JobTimeoutError(f'Job exceeded {self.timeout}s')
+
+    def stream(self, fn, *args):
+        """
+        在进程池中运行生成器函数 fn(*args)，返回逐个产出结果的异步迭代器。
+        准入检查在调用时立即进行，队列已满时直接抛出 QueueFullError；
+        整个任务的时限仍为 timeout，超时后迭代器抛出 JobTimeoutError。
+        调用方不再读取时应调用 aclose()，即使还没有开始迭代。
+        """
+        manager = self._get_manager()
+        results = manager.Queue(maxsize=STREAM_BUFFER_SIZE)
+        cancelled = manager.Event()
+        future = self._start(_pump, fn, args, results, cancelled)
+        return _ResultStream(self, future, results, cancelled)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        if self._poller is not None:
+            self._poller.shutdown(wait=False)
+            self._poller = None
+        if self._manager is not None:
+            self._manager.shutdown()
+            self._manager = None
@@ -0,0 +1,94 @@
+import os
+import io
+import sys
+import tarfile
+import zipfile
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import archive
+from services.archive import ArchiveLimitError, spool_member, unpack_archive
+
+EXTENSIONS = ['.docx', '.pdf', '.doc', '.txt']
+
+
+@pytest.fixture
+def spool_dir(tmp_path, monkeypatch):
+    path = tmp_path / 'spool'
+    path.mkdir()
+    monkeypatch.setattr(archive, 'ARCHIVE_SPOOL_DIR', str(path))
+    return path
+
+
+def make_zip(path, members):
+    with zipfile.ZipFile(path, 'w') as zf:
+        for name, data in members:
+            zf.writestr(name, data)
+    return str(path)
+
+
+def make_tar(path, members):
+    with tarfile.open(path, 'w') as tf:
+        for name, data in members:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tf.addfile(info, io.BytesIO(data))
+    return str(path)
+
+
+def test_unpack_skips_unsupported_members(tmp_path, spool_dir):
+    source = make_zip(tmp_path / 'a.zip', [('a.txt', b'hello'), ('b.png', b'img'), ('dir/c.pdf', b'%PDF')])
+    members = unpack_archive(source, 'a.zip', EXTENSIONS, 10)
+    assert [name for name, _, _ in members] == ['a.txt', 'dir/c.pdf']
+    with open(members[0][1], 'rb') as f:
+        assert f.read() == b'hello'
+    assert len(os.listdir(spool_dir)) == 2
+
+
+def test_member_count_limit(tmp_path, spool_dir, monkeypatch):
+    monkeypatch.setattr(archive, 'ARCHIVE_MAX_MEMBERS', 2)
+    # 跳过的条目也计数
+    source = make_tar(tmp_path / 'a.tar', [('a.png', b'x'), ('b.png', b'x'), ('c.txt', b'x')])
+    with pytest.raises(ArchiveLimitError):
+        unpack_archive(source, 'a.tar', EXTENSIONS, 10)
+    assert os.listdir(spool_dir) == []
+
+
+def test_max_files_limit(tmp_path, spool_dir):
+    source = make_zip(tmp_path / 'a.zip', [('a.txt', b'x'), ('b.txt', b'x'), ('c.txt', b'x')])
+    with pytest.raises(ArchiveLimitError):
+        unpack_archive(source, 'a.zip', EXTENSIONS, 2)
+    assert os.listdir(spool_dir) == []
+
+
+def test_declared_member_size_limit(tmp_path, spool_dir, monkeypatch):
+    monkeypatch.setattr(archive, 'ARCHIVE_MAX_MEMBER_SIZE', 10)
+    source = make_zip(tmp_path / 'a.zip', [('a.txt', b'small'), ('b.txt', b'x' * 11)])
+    with pytest.raises(ArchiveLimitError):
+        unpack_archive(source, 'a.zip', EXTENSIONS, 10)
+    # 已经展开的 a.txt 被删除
+    assert os.listdir(spool_dir) == []
+
+
+def test_declared_total_size_limit(tmp_path, spool_dir, monkeypatch):
+    monkeypatch.setattr(archive, 'ARCHIVE_MAX_TOTAL_SIZE', 15)
+    source = make_tar(tmp_path / 'a.tar', [('a.txt', b'x' * 10), ('b.txt', b'x' * 10)])
+    with pytest.raises(ArchiveLimitError):
+        unpack_archive(source, 'a.tar', EXTENSIONS, 10)
+    assert os.listdir(spool_dir) == []
+
+
+def test_forged_size_is_checked_while_decompressing(spool_dir, monkeypatch):
+    # 声明的大小可能是伪造的：实际读出的字节数超过上限时同样报错，并删除写了一半的临时文件
+    monkeypatch.setattr(archive, 'ARCHIVE_MAX_MEMBER_SIZE', 1024)
+    monkeypatch.setattr(archive, 'ARCHIVE_CHUNK_SIZE', 100)
+    with pytest.raises(ArchiveLimitError):
+        spool_member(io.BytesIO(b'x' * 2048), 'a.txt', budget=10 ** 9)
+    assert os.listdir(spool_dir) == []
+
+
+def test_forged_size_counts_against_total_budget(spool_dir):
+    with pytest.raises(ArchiveLimitError):
+        spool_member(io.BytesIO(b'x' * 200), 'a.txt', budget=100)
+    assert os.listdir(spool_dir) == []
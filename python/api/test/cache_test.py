@@ -0,0 +1,127 @@
+import os
+import sys
+import time
+import asyncio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.cache import LRUCache
+from services.result_cache import ResultCache, result_key
+
+
+def test_evicts_least_recently_used():
+    cache = LRUCache(max_items=2)
+    cache.set('a', 'A')
+    cache.set('b', 'B')
+    assert cache.get('a') == 'A'
+    cache.set('c', 'C')
+    assert cache.get('b') is None
+    assert cache.get('a') == 'A'
+    assert cache.get('c') == 'C'
+    assert cache.stats()['hits'] == 3
+    assert cache.stats()['misses'] == 1
+
+
+def test_max_bytes():
+    cache = LRUCache(max_items=100, max_bytes=10)
+    cache.set('a', 'x' * 6)
+    cache.set('b', 'y' * 6)
+    assert cache.get('a') is None
+    assert cache.stats()['bytes'] == 6
+
+
+def test_ttl():
+    cache = LRUCache(ttl=0.05)
+    cache.set('a', 'A')
+    assert cache.get('a') == 'A'
+    time.sleep(0.1)
+    assert cache.get('a') is None
+    assert len(cache) == 0
+
+
+def test_disk_tier(tmp_path):
+    cache = LRUCache(max_items=1, disk_dir=str(tmp_path))
+    cache.set('aa11', '图片文字')
+    cache.set('bb22', 'other')
+    # 已从内存淘汰的条目从磁盘读回
+    assert cache.get('aa11') == '图片文字'
+    # 新的缓存实例（例如另一个工作进程）也能命中
+    assert LRUCache(disk_dir=str(tmp_path)).get('bb22') == 'other'
+
+
+def test_result_cache_coalesces_concurrent_jobs():
+    runs = []
+
+    async def extract():
+        runs.append(1)
+        await asyncio.sleep(0.05)
+        return [{'document': 'a.pdf', 'page': 1, 'text': 'hello', 'ocr_text': None}]
+
+    async def run():
+        cache = ResultCache(max_items=4)
+        key = result_key('ab' * 32, '.pdf', 1)
+        results = await asyncio.gather(*[cache.get_or_run(key, extract) for _ in range(3)])
+        results.append(await cache.get_or_run(key, extract))
+        return cache, results
+
+    cache, results = asyncio.run(run())
+    assert len(runs) == 1
+    assert all(blocks[0]['text'] == 'hello' for blocks in results)
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['coalesced'], stats['inflight']) == (1, 3, 2, 0)
+
+
+def test_result_cache_disk_tier_off_event_loop(tmp_path):
+    async def extract():
+        return [{'document': 'a.pdf', 'page': 1, 'text': 'hello', 'ocr_text': None}]
+
+    async def run():
+        cache = ResultCache(max_items=4, disk_dir=str(tmp_path))
+        key = result_key('cd' * 32, '.pdf', 1)
+        await cache.get_or_run(key, extract)
+        # 磁盘写入在线程池中完成后才移除正在执行的登记
+        for _ in range(20):
+            if not cache.stats()['inflight']:
+                break
+            await asyncio.sleep(0.05)
+        assert cache.stats()['inflight'] == 0
+        return await ResultCache(disk_dir=str(tmp_path)).aget(key)
+
+    assert asyncio.run(run())[0]['text'] == 'hello'
+
+
+def test_result_cache_wait_timeout():
+    async def run():
+        cache = ResultCache(max_items=4, wait_timeout=0.05)
+        key = result_key('ef' * 32, '.pdf', 1)
+        # 登记后永远不会完成的任务（例如响应被取消而没有清理）：等待方超时而不是一直挂起
+        cache.start(key)
+        try:
+            await cache.get_or_run(key, None)
+        except TimeoutError:
+            return True
+        return False
+
+    assert asyncio.run(run())
+
+
+def test_result_cache_skips_failed_ocr():
+    runs = []
+
+    async def extract():
+        runs.append(1)
+        return [{'document': 'a.pdf', 'page': 1, 'text': '', 'ocr_text': None, 'ocr_failed': True}]
+
+    async def run():
+        cache = ResultCache(max_items=4)
+        key = result_key('12' * 32, '.pdf', 1, 'baidu-t100-d200')
+        first = await cache.get_or_run(key, extract)
+        await cache.get_or_run(key, extract)
+        return cache, first
+
+    cache, first = asyncio.run(run())
+    # OCR 出错的结果照常返回，但不缓存，下次请求重新提取
+    assert first[0]['ocr_failed']
+    assert len(runs) == 2
+    assert cache.stats()['items'] == 0
+    assert result_key('12' * 32, '.pdf', 1, 'baidu-t100-d200') != result_key('12' * 32, '.pdf', 1, 'deepdoc-t100-d200')
@@ -0,0 +1,209 @@
+import os
+import sys
+import time
+import asyncio
+import threading
+import pytest
+import nltk
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+NLTK_DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "nltk_data")
+nltk.data.path = [NLTK_DATA_PATH] + nltk.data.path
+
+from services.cache import LRUCache
+from services.fetch import Crawler
+
+SLOW_DELAY = 2
+
+# 本地测试站点：路径 -> (标题, 正文, 链接)
+PAGES = {
+    "/": ("Root", "The root page links to everything. It is the start of the crawl.", ["/a", "/b", "/slow", "mailto:x@y.z"]),
+    "/a": ("Page A", "Page A talks about apples. Apples are red.", ["/c", "/"]),
+    "/b": ("Page B", "Page B talks about bananas. Bananas are yellow.", []),
+    "/c": ("Page C", "Page C is only reachable from page A.", []),
+    "/slow": ("Slow", "This page takes a long time to answer.", []),
+    "/etag": ("Etag", "This page supports conditional requests.", []),
+}
+ETAG = '"v1"'
+# 每个路径收到的 (状态码) 列表
+REQUESTS = {}
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path not in PAGES:
+            self.send_error(404)
+            return
+        if self.path == "/slow":
+            time.sleep(SLOW_DELAY)
+        if self.path == "/etag" and self.headers.get("If-None-Match") == ETAG:
+            REQUESTS.setdefault(self.path, []).append(304)
+            self.send_response(304)
+            self.end_headers()
+            return
+        REQUESTS.setdefault(self.path, []).append(200)
+        title, text, links = PAGES[self.path]
+        anchors = "".join(f'<a href="{link}">{link}</a>' for link in links)
+        body = f"<html><head><title>{title}</title></head><body><p>{text}</p>{anchors}</body></html>".encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        if self.path == "/etag":
+            self.send_header("ETag", ETAG)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def site():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FixtureHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+def crawl(url, level, **kwargs):
+    kwargs.setdefault("host_interval", 0)
+    kwargs.setdefault("cache", None)
+    return asyncio.run(Crawler(**kwargs).crawl(url, level))
+
+
+def test_level_one_fetches_start_page_only(site):
+    results = crawl(site + "/", 1)
+    assert [(url, title) for url, title, _ in results] == [(site + "/", "Root")]
+    assert "root page" in results[0][2]
+
+
+def test_bfs_by_level_in_discovery_order(site):
+    results = crawl(site + "/", 3, deadline=10)
+    assert [url for url, _, _ in results] == [site + path for path in ["/", "/a", "/b", "/slow", "/c"]]
+
+
+def test_max_pages(site):
+    results = crawl(site + "/", 3, max_pages=2)
+    assert [url for url, _, _ in results] == [site + "/", site + "/a"]
+
+
+def test_deadline_returns_partial_results(site):
+    start = time.time()
+    results = crawl(site + "/", 2, deadline=1)
+    assert time.time() - start < SLOW_DELAY
+    assert [url for url, _, _ in results] == [site + path for path in ["/", "/a", "/b"]]
+
+
+def test_per_host_interval(site):
+    start = time.time()
+    results = crawl(site + "/", 2, host_interval=0.3, max_pages=3)
+    # 同一站点的三次请求之间至少间隔两次 interval
+    assert len(results) == 3
+    assert time.time() - start >= 0.6
+
+
+class FakeResponse:
+    status = 200
+    headers = {"Content-Type": "text/html"}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    async def text(self, errors=None):
+        return "<html></html>"
+
+
+class FakeSession:
+    def get(self, url, headers=None):
+        return FakeResponse()
+
+
+def test_rate_limited_host_does_not_block_other_hosts():
+    from services.fetch import HostRateLimiter
+
+    async def run():
+        crawler = Crawler()
+        rate_limiter = HostRateLimiter(0.5)
+        semaphore = asyncio.Semaphore(1)
+        fetch = lambda url: crawler._fetch(FakeSession(), rate_limiter, semaphore, url, {})
+        start = time.time()
+        same_host = [asyncio.ensure_future(fetch(f"http://a.test/{i}")) for i in range(4)]
+        await asyncio.sleep(0)
+        # 等待限速的任务不占用并发名额，另一个站点的请求立即完成
+        await fetch("http://b.test/")
+        elapsed = time.time() - start
+        await asyncio.gather(*same_host)
+        return elapsed
+
+    assert asyncio.run(run()) < 0.3
+
+
+def test_fetch_cache_revalidates_with_etag(site, monkeypatch):
+    import services.fetch as fetch
+    calls = []
+    original = fetch.summarize_page
+    monkeypatch.setattr(fetch, "summarize_page", lambda *args: calls.append(args[0]) or original(*args))
+    cache = LRUCache()
+    REQUESTS.clear()
+
+    first = crawl(site + "/etag#top", 1, cache=cache, cache_ttl=0)
+    second = crawl(site + "/etag", 1, cache=cache, cache_ttl=0)
+    assert first == second == [(site + "/etag", "Etag", first[0][2])]
+    # 第二次抓取返回 304，不再解析
+    assert REQUESTS["/etag"] == [200, 304]
+    assert len(calls) == 1
+
+    # TTL 内直接使用缓存，不发请求
+    crawl(site + "/etag", 1, cache=cache, cache_ttl=60)
+    assert REQUESTS["/etag"] == [200, 304]
+
+
+def test_fetch_cache_skips_parsing_unchanged_body(site, monkeypatch):
+    import services.fetch as fetch
+    calls = []
+    original = fetch.summarize_page
+    monkeypatch.setattr(fetch, "summarize_page", lambda *args: calls.append(args[0]) or original(*args))
+    cache = LRUCache()
+
+    crawl(site + "/b", 1, cache=cache, cache_ttl=0)
+    crawl(site + "/b", 1, cache=cache, cache_ttl=0)
+    assert calls == [site + "/b"]
+
+
+def test_score_sentences_matches_reference():
+    from services.fetch import IDFTable, score_sentences
+    text = "Apples are red. Bananas are yellow. Apples and bananas are fruit. Apples are red."
+    idf_table = IDFTable()
+    idf_table.add_document(nltk.word_tokenize("Bananas grow on trees."))
+    idf_table.add_document(nltk.word_tokenize(text))
+
+    tokenized_sentences = [(s, nltk.word_tokenize(s)) for s in nltk.sent_tokenize(text)]
+    scores = score_sentences(tokenized_sentences, idf_table)
+
+    # 逐词计算的参考实现
+    words = nltk.word_tokenize(text)
+    expected = {}
+    for sentence, tokens in tokenized_sentences:
+        for word in tokens:
+            idf = float(idf_table.idf([word])[0])
+            expected[sentence] = expected.get(sentence, 0) + words.count(word) / len(words) * idf
+    assert scores.keys() == expected.keys()
+    for sentence in expected:
+        assert scores[sentence] == pytest.approx(expected[sentence])
+
+
+def test_idf_table_prunes_lowest_document_frequency():
+    from services.fetch import IDFTable
+    idf_table = IDFTable(max_terms=10)
+    for _ in range(3):
+        idf_table.add_document([f"common{i}" for i in range(5)])
+    for i in range(20):
+        idf_table.add_document([f"rare{i}", f"rare{i + 100}"])
+    # 词表始终不超过上限，常见词不会被淘汰
+    assert len(idf_table.doc_freq) <= 10
+    assert all(idf_table.doc_freq[f"common{i}"] == 3 for i in range(5))
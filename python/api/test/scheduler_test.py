@@ -0,0 +1,175 @@
+import os
+import sys
+import time
+import signal
+import asyncio
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.scheduler import JobScheduler, QueueFullError, JobTimeoutError
+
+
+def slow_square(x, delay):
+    time.sleep(delay)
+    return x * x
+
+
+def test_submit_returns_result():
+    async def run():
+        scheduler = JobScheduler(max_workers=2, max_queue=2, timeout=10)
+        try:
+            return await asyncio.gather(*[scheduler.submit(slow_square, i, 0) for i in range(4)])
+        finally:
+            scheduler.shutdown()
+
+    assert asyncio.run(run()) == [0, 1, 4, 9]
+
+
+def test_rejects_when_queue_full():
+    async def run():
+        scheduler = JobScheduler(max_workers=1, max_queue=1, timeout=10, retry_after=7)
+        try:
+            jobs = [asyncio.ensure_future(scheduler.submit(slow_square, 2, 0.5)) for _ in range(2)]
+            await asyncio.sleep(0)
+            with pytest.raises(QueueFullError) as exc:
+                await scheduler.submit(slow_square, 3, 0)
+            assert exc.value.retry_after == 7
+            await asyncio.gather(*jobs)
+            # 任务完成后名额被释放
+            assert scheduler.pending == 0
+            return await scheduler.submit(slow_square, 3, 0)
+        finally:
+            scheduler.shutdown()
+
+    assert asyncio.run(run()) == 9
+
+
+def test_job_timeout():
+    async def run():
+        scheduler = JobScheduler(max_workers=1, max_queue=0, timeout=0.2)
+        try:
+            with pytest.raises(JobTimeoutError):
+                await scheduler.submit(slow_square, 2, 5)
+            # 任务在工作进程中被中止，名额随即释放
+            for _ in range(20):
+                if scheduler.pending == 0:
+                    break
+                await asyncio.sleep(0.05)
+            assert scheduler.pending == 0
+            return await scheduler.submit(slow_square, 3, 0)
+        finally:
+            scheduler.shutdown()
+
+    assert asyncio.run(run()) == 9
+
+
+def ignore_deadline_and_sleep(delay):
+    signal.signal(signal.SIGALRM, signal.SIG_IGN)
+    time.sleep(delay)
+
+
+def test_stuck_job_recycles_pool():
+    async def run():
+        scheduler = JobScheduler(max_workers=1, max_queue=0, timeout=0.2, kill_grace=0.2)
+        try:
+            with pytest.raises(JobTimeoutError):
+                await scheduler.submit(ignore_deadline_and_sleep, 30)
+            # 收不到 SIGALRM 的任务在 timeout + kill_grace 后随进程池一起结束
+            for _ in range(40):
+                if scheduler.pending == 0:
+                    break
+                await asyncio.sleep(0.05)
+            assert scheduler.pending == 0
+            return await scheduler.submit(slow_square, 3, 0)
+        finally:
+            scheduler.shutdown()
+
+    assert asyncio.run(run()) == 9
+
+
+def count_up(n, fail_at=None):
+    for i in range(n):
+        if i == fail_at:
+            raise ValueError('broken page')
+        yield i
+
+
+def test_stream_yields_in_order():
+    async def run():
+        scheduler = JobScheduler(max_workers=1, max_queue=0, timeout=10)
+        try:
+            return [item async for item in scheduler.stream(count_up, 20)]
+        finally:
+            scheduler.shutdown()
+
+    assert asyncio.run(run()) == list(range(20))
+
+
+def test_stream_propagates_errors():
+    async def run():
+        scheduler = JobScheduler(max_workers=1, max_queue=0, timeout=10)
+        items = []
+        try:
+            with pytest.raises(ValueError):
+                async for item in scheduler.stream(count_up, 5, 2):
+                    items.append(item)
+            # 准入检查在调用 stream 时立即进行
+            scheduler._pending = scheduler.capacity
+            with pytest.raises(QueueFullError):
+                scheduler.stream(count_up, 1)
+        finally:
+            scheduler.shutdown()
+        return items
+
+    assert asyncio.run(run()) == [0, 1]
+
+
+def test_stream_cancel_frees_worker():
+    async def run():
+        scheduler = JobScheduler(max_workers=1, max_queue=0, timeout=30)
+        try:
+            blocks = scheduler.stream(count_up, 1000)
+            assert await blocks.__anext__() == 0
+            # 客户端断开：工作进程很快放弃任务，而不是等到 put 超时
+            await blocks.aclose()
+            for _ in range(40):
+                if scheduler.pending == 0:
+                    break
+                await asyncio.sleep(0.05)
+            assert scheduler.pending == 0
+            return await scheduler.submit(slow_square, 3, 0)
+        finally:
+            scheduler.shutdown()
+
+    assert asyncio.run(run()) == 9
+
+
+def test_unstarted_stream_close_frees_worker():
+    async def run():
+        scheduler = JobScheduler(max_workers=1, max_queue=0, timeout=30)
+        try:
+            blocks = scheduler.stream(count_up, 1000)
+            # 响应还没有开始输出就被取消：从未迭代过的流关闭时也要停止任务
+            await blocks.aclose()
+            for _ in range(40):
+                if scheduler.pending == 0:
+                    break
+                await asyncio.sleep(0.05)
+            assert scheduler.pending == 0
+            return await scheduler.submit(slow_square, 3, 0)
+        finally:
+            scheduler.shutdown()
+
+    assert asyncio.run(run()) == 9
+
+
+def test_submit_wait_for_slot():
+    async def run():
+        scheduler = JobScheduler(max_workers=1, max_queue=1, timeout=10)
+        try:
+            return await asyncio.gather(*[scheduler.submit(slow_square, i, 0.05, wait=True) for i in range(5)])
+        finally:
+            scheduler.shutdown()
+
+    assert asyncio.run(run()) == [0, 1, 4, 9, 16]
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Time: 2023/11/7 22:45
+@Author: zhidong
+@File: app.py
+@Desc: 多模型重排服务，请求中的 model 字段选择模型，模型按需加载，超出内存预算时淘汰最久未使用的模型
+"""
+import os
+import uvicorn
+from fastapi import FastAPI, Security, HTTPException
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from pydantic import Field, BaseModel, validator
+from typing import Optional, List
+from reranker import DEFAULT_MODEL, ModelPool, MicroBatcher, ScoreCache, Chat
+
+app = FastAPI()
+security = HTTPBearer()
+env_bearer_token = 'ACCESS_TOKEN'
+
+# 启动时预先加载的模型，逗号分隔，默认不预加载
+WARMUP_MODELS = [name.strip() for name in os.getenv("RERANK_WARMUP_MODELS", "").split(",") if name.strip()]
+
+class QADocs(BaseModel):
+    # 使用的模型，不传时使用 RERANK_DEFAULT_MODEL
+    model: Optional[str] = None
+    query: Optional[str]
+    documents: Optional[List[str]]
+    # 只返回得分最高的 top_n 个结果，不传时返回全部
+    top_n: Optional[int] = None
+    # 结果中是否带上文档内容
+    return_documents: Optional[bool] = False
+
+    @validator('top_n')
+    def check_top_n(cls, v):
+        if v is not None and v <= 0:
+            raise ValueError('top_n must be a positive integer')
+        return v
+
+
+@app.post('/v1/rerank')
+async def handle_post_request(docs: QADocs, credentials: HTTPAuthorizationCredentials = Security(security)):
+    token = credentials.credentials
+    if env_bearer_token is not None and token != env_bearer_token:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    model = docs.model or DEFAULT_MODEL
+    if model not in ModelPool().models:
+        raise HTTPException(status_code=400, detail=f"Unknown model: {model}")
+    chat = Chat(model)
+    try:
+        results = await chat.fit_query_answer_rerank(docs)
+        return {"model": model, "results": results}
+    except Exception as e:
+        print(f"报错：\n{e}")
+        return {"error": "重排出错"}
+
+# 得分缓存的命中情况，用于调整缓存大小
+@app.get('/v1/cache_stats')
+async def cache_stats(credentials: HTTPAuthorizationCredentials = Security(security)):
+    if env_bearer_token is not None and credentials.credentials != env_bearer_token:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    return ScoreCache().stats()
+
+# 可用的模型及是否已加载
+@app.get('/v1/models')
+async def list_models(credentials: HTTPAuthorizationCredentials = Security(security)):
+    if env_bearer_token is not None and credentials.credentials != env_bearer_token:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    pool = ModelPool()
+    return {"data": [{"id": name, "loaded": pool.is_loaded(name)} for name in pool.models]}
+
+# 启动时预热 RERANK_WARMUP_MODELS 中的模型，避免第一个请求等待模型加载
+@app.on_event("startup")
+async def warmup_models():
+    batcher = MicroBatcher(ModelPool())
+    for model in WARMUP_MODELS:
+        await batcher.load(model)
+
+if __name__ == "__main__":
+    token = os.getenv("ACCESS_TOKEN")
+    if token is not None:
+        env_bearer_token = token
+    try:
+        uvicorn.run(app, host='0.0.0.0', port=6006)
+    except Exception as e:
+        print(f"API启动失败！\n报错：\n{e}")
@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@File: benchmark.py
+@Desc: 重排服务的压测脚本，统计 pairs/s、请求延迟的 p50/p95/p99 和峰值内存，结果保存为 JSON
+
+用法：
+    # 压测本地服务（--server-pid 用于读取服务进程的峰值内存）
+    python benchmark.py --url http://127.0.0.1:6006/v1/rerank --token mytoken --concurrency 8
+    # 直接在当前进程中调用 ReRanker
+    python benchmark.py --model bge-reranker-base --concurrency 1
+    # 保存结果，并与上一次的结果对比
+    python benchmark.py --url ... --output new.json --compare old.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import resource
+import argparse
+import threading
+import urllib.request
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+WORDS = ("the a of to and in is for on with rerank model document query passage search result "
+         "vector index token score batch memory latency throughput server request answer question "
+         "重排 模型 文档 问题 检索 结果 向量 知识库 回答 得分").split()
+
+
+def synthetic_pairs(num_pairs: int, query_words: int = 12, doc_words: int = 200, seed: int = 0):
+    """生成固定随机种子的 (query, document) 对，文档长度在 doc_words 的 10% 到 100% 之间"""
+    rng = random.Random(seed)
+    queries = [" ".join(rng.choices(WORDS, k=query_words)) for _ in range(max(1, num_pairs // 16))]
+    return [[rng.choice(queries), " ".join(rng.choices(WORDS, k=rng.randint(max(1, doc_words // 10), doc_words)))]
+            for _ in range(num_pairs)]
+
+
+def synthetic_requests(num_requests: int, docs: int, query_words: int, doc_words: int, seed: int = 0):
+    """每个请求为一个 query 和 docs 个候选文档"""
+    rng = random.Random(seed)
+    return [{"query": " ".join(rng.choices(WORDS, k=query_words)),
+             "documents": [pair[1] for pair in synthetic_pairs(docs, query_words, doc_words, seed=rng.random())]}
+            for _ in range(num_requests)]
+
+
+def http_sender(url: str, token: str, model: str = None):
+    def send(request):
+        body = dict(request, model=model) if model else request
+        req = urllib.request.Request(url, data=json.dumps(body).encode("utf-8"), method="POST",
+                                     headers={"Content-Type": "application/json",
+                                              "Authorization": f"Bearer {token}"})
+        with urllib.request.urlopen(req) as response:
+            result = json.loads(response.read())
+        if "error" in result:
+            raise RuntimeError(result["error"])
+    return send
+
+
+def direct_sender(model: str, backend: str):
+    from reranker import MODEL_DIR, RERANKERS
+    reranker = RERANKERS[backend](os.path.join(MODEL_DIR, model))
+
+    def send(request):
+        reranker.compute_score([[request["query"], doc] for doc in request["documents"]])
+    return send
+
+
+def peak_rss_mb(pid: int = None) -> float:
+    """进程的峰值内存（MB）；pid 为空时为当前进程"""
+    if pid is None:
+        # Linux 上 ru_maxrss 的单位为 KB，macOS 上为字节
+        scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def run(send, requests, concurrency: int, warmup: int):
+    for request in requests[:warmup]:
+        send(request)
+    requests = requests[warmup:]
+
+    latencies = []
+    pairs = []
+    errors = []
+    lock = threading.Lock()
+
+    def timed(request):
+        start = time.perf_counter()
+        try:
+            send(request)
+        except Exception as e:
+            with lock:
+                errors.append(str(e))
+            return
+        with lock:
+            latencies.append(time.perf_counter() - start)
+            pairs.append(len(request["documents"]))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(timed, requests))
+    elapsed = time.perf_counter() - start
+
+    latencies_ms = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "elapsed_s": round(elapsed, 3),
+        "pairs_per_s": round(sum(pairs) / elapsed, 2),
+        "requests_per_s": round(len(latencies) / elapsed, 2),
+        "latency_ms": {
+            "p50": round(float(np.percentile(latencies_ms, 50)), 2),
+            "p95": round(float(np.percentile(latencies_ms, 95)), 2),
+            "p99": round(float(np.percentile(latencies_ms, 99)), 2),
+            "max": round(float(latencies_ms.max()), 2),
+        },
+    }
+
+
+def compare(old: dict, new: dict):
+    rows = [("pairs_per_s", old["result"]["pairs_per_s"], new["result"]["pairs_per_s"])]
+    rows += [(f"latency_ms.{k}", old["result"]["latency_ms"][k], new["result"]["latency_ms"][k])
+             for k in ("p50", "p95", "p99")]
+    rows.append(("peak_rss_mb", old["result"]["peak_rss_mb"], new["result"]["peak_rss_mb"]))
+    for name, before, after in rows:
+        if before is None or after is None:
+            continue
+        change = (after - before) / before * 100 if before else 0.0
+        print(f"{name:16} {before:>10} -> {after:>10} ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--url", help="重排服务地址，例如 http://127.0.0.1:6006/v1/rerank")
+    target.add_argument("--model", help="直接在当前进程中加载 RERANK_MODEL_DIR 下的模型")
+    parser.add_argument("--token", default=os.getenv("ACCESS_TOKEN", "ACCESS_TOKEN"))
+    parser.add_argument("--request-model", help="请求中的 model 字段（多模型服务）")
+    parser.add_argument("--backend", default="torch", help="--model 模式的推理后端：torch 或 onnx")
+    parser.add_argument("--server-pid", type=int, help="服务进程的 pid，用于读取峰值内存")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--docs", type=int, default=20, help="每个请求的候选文档数")
+    parser.add_argument("--query-words", type=int, default=12)
+    parser.add_argument("--doc-words", type=int, default=200, help="文档的最大词数")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="保存结果的 JSON 文件")
+    parser.add_argument("--compare", help="与之前保存的 JSON 结果对比")
+    args = parser.parse_args()
+
+    requests = synthetic_requests(args.requests + args.warmup, args.docs, args.query_words, args.doc_words, args.seed)
+    if args.url:
+        send = http_sender(args.url, args.token, args.request_model)
+    else:
+        send = direct_sender(args.model, args.backend)
+
+    result = run(send, requests, args.concurrency, args.warmup)
+    if args.url and args.server_pid is None:
+        result["peak_rss_mb"] = None
+    else:
+        result["peak_rss_mb"] = round(peak_rss_mb(args.server_pid if args.url else None), 1)
+    report = {
+        "config": {k: v for k, v in vars(args).items() if k not in ("token", "output", "compare")},
+        "env": {k: v for k, v in os.environ.items() if k.startswith("RERANK_")},
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "result": result,
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
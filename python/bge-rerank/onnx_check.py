@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@File: onnx_check.py
+@Desc: 对比 onnx 后端与 torch 后端的得分（一致性检查）和吞吐量
+
+用法：
+    python onnx_check.py --model bge-reranker-base
+    python onnx_check.py --model bge-reranker-base --quantize --tolerance 0.05
+"""
+import os
+import time
+import argparse
+import numpy as np
+from reranker import MODEL_DIR, ReRanker, OnnxReRanker
+from benchmark import synthetic_pairs
+
+
+def throughput(reranker: ReRanker, pairs, rounds: int):
+    reranker.compute_score(pairs[:reranker.batch_size])
+    start = time.perf_counter()
+    for _ in range(rounds):
+        scores = reranker.compute_score(pairs)
+    return np.array(scores), len(pairs) * rounds / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", required=True, help="RERANK_MODEL_DIR 下的模型名")
+    parser.add_argument("--quantize", action="store_true", help="使用动态 int8 量化的 onnx 模型")
+    parser.add_argument("--pairs", type=int, default=256)
+    parser.add_argument("--doc-words", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--tolerance", type=float, default=1e-3, help="允许的最大得分差")
+    args = parser.parse_args()
+
+    model_path = os.path.join(MODEL_DIR, args.model)
+    pairs = synthetic_pairs(args.pairs, doc_words=args.doc_words)
+    torch_scores, torch_speed = throughput(ReRanker(model_path), pairs, args.rounds)
+    onnx_scores, onnx_speed = throughput(OnnxReRanker(model_path, quantize=args.quantize), pairs, args.rounds)
+
+    diff = np.abs(torch_scores - onnx_scores)
+    print(f"得分差：max={diff.max():.6f} mean={diff.mean():.6f}")
+    print(f"吞吐量（pairs/s）：torch={torch_speed:.1f} onnx{'-int8' if args.quantize else ''}={onnx_speed:.1f} "
+          f"({onnx_speed / torch_speed:.2f}x)")
+    if diff.max() > args.tolerance:
+        raise SystemExit(f"得分差超过 {args.tolerance}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,370 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@File: reranker.py
+@Desc: 重排服务的公共部分：模型加载（torch / onnx 后端）、按长度分桶推理、微批处理和得分缓存，
+       供多模型服务 app.py 和各单模型目录下的 app.py 共用
+"""
+import os
+import time
+import asyncio
+import hashlib
+import threading
+import gc
+import numpy as np
+from FlagEmbedding import FlagReranker
+from typing import Optional, List
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+
+# 模型设置：模型目录 RERANK_MODEL_DIR 下每个子目录为一个模型，子目录名即请求中的 model
+MODEL_DIR = os.getenv("RERANK_MODEL_DIR", os.path.join(os.path.dirname(__file__), "models"))
+MODELS = [name.strip() for name in os.getenv(
+    "RERANK_MODELS", "bge-reranker-base,bge-reranker-large,bge-reranker-v2-m3").split(",") if name.strip()]
+if not MODELS:
+    raise ValueError("RERANK_MODELS is empty, configure at least one model")
+# 请求中没有 model 字段时使用的模型，默认为 RERANK_MODELS 中的第一个
+DEFAULT_MODEL = os.getenv("RERANK_DEFAULT_MODEL") or MODELS[0]
+if DEFAULT_MODEL not in MODELS:
+    raise ValueError(f"RERANK_DEFAULT_MODEL {DEFAULT_MODEL} is not in RERANK_MODELS")
+# 已加载模型的内存预算（MB），超出时淘汰最久未使用的模型，0 表示不限制
+MEMORY_BUDGET_MB = int(os.getenv("RERANK_MEMORY_BUDGET_MB", 0))
+# 微批处理设置：收集并发请求的 (query, document) 对，
+# 最多等待 RERANK_BATCH_WAIT_MS 毫秒或攒够 RERANK_MAX_BATCH_PAIRS 对后一起推理
+BATCH_WAIT_MS = float(os.getenv("RERANK_BATCH_WAIT_MS", 5))
+MAX_BATCH_PAIRS = int(os.getenv("RERANK_MAX_BATCH_PAIRS", 64))
+# 推理设置：按 token 数排序后每 RERANK_BATCH_SIZE 对组成一批，超过 RERANK_MAX_LENGTH 个 token 的部分截断
+BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", 32))
+MAX_LENGTH = int(os.getenv("RERANK_MAX_LENGTH", 512))
+# 得分缓存设置：最多缓存 RERANK_CACHE_SIZE 个 (query, document) 对的得分，RERANK_CACHE_TTL 秒后过期，设为 0 时关闭缓存
+CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", 100000))
+CACHE_TTL = float(os.getenv("RERANK_CACHE_TTL", 600))
+# 推理后端：torch（FlagReranker）或 onnx（ONNX Runtime，首次加载时从模型导出到 <模型目录>/onnx）
+BACKEND = os.getenv("RERANK_BACKEND", "torch")
+# onnx 后端是否使用动态 int8 量化的模型
+ONNX_QUANTIZE = os.getenv("RERANK_ONNX_QUANTIZE", "0") == "1"
+# ONNX Runtime 算子内的线程数，0 表示使用 ONNX Runtime 的默认值（物理核数）
+ORT_THREADS = int(os.getenv("RERANK_ORT_THREADS", 0))
+
+
+class Singleton(type):
+    def __call__(cls, *args, **kwargs):
+        if not hasattr(cls, '_instance'):
+            cls._instance = super().__call__(*args, **kwargs)
+        return cls._instance
+
+
+class ReRanker(object):
+    def __init__(self, model_path, batch_size: int = BATCH_SIZE, max_length: int = MAX_LENGTH):
+        self.reranker = FlagReranker(model_path, use_fp16=False)
+        self.tokenizer = self.reranker.tokenizer
+        self.batch_size = batch_size
+        self.max_length = max_length
+
+    @staticmethod
+    def memory_size(model_path: str) -> int:
+        return model_size(model_path)
+
+    def score_batch(self, pairs: List[List[str]]) -> List[float]:
+        result = self.reranker.compute_score(pairs, batch_size=self.batch_size,
+                                             max_length=self.max_length, normalize=True)
+        if isinstance(result, float):
+            result = [result]
+        return result
+
+    def token_lengths(self, pairs: List[List[str]]) -> List[int]:
+        """每个 (query, document) 对截断后的 token 数；中文和英文每个字符对应的 token 数差别很大，不能用字符数代替"""
+        encoded = self.tokenizer(pairs, truncation=True, max_length=self.max_length)
+        return [len(input_ids) for input_ids in encoded["input_ids"]]
+
+    def compute_score(self, pairs: List[List[str]]):
+        if len(pairs) > 0:
+            # 按 token 数分桶：长度相近的放在同一批，避免一个长文档把整批都填充到最大长度
+            lengths = self.token_lengths(pairs)
+            order = sorted(range(len(pairs)), key=lambda i: lengths[i])
+            scores = [0.0] * len(pairs)
+            for start in range(0, len(order), self.batch_size):
+                bucket = order[start:start + self.batch_size]
+                result = self.score_batch([pairs[i] for i in bucket])
+                for index, score in zip(bucket, result):
+                    scores[index] = score
+            return scores
+        else:
+            return None
+
+
+def model_size(model_path: str) -> int:
+    """按权重文件的大小估算模型加载后占用的内存"""
+    size = 0
+    for root, _, files in os.walk(model_path):
+        for name in files:
+            if name.endswith((".bin", ".safetensors")):
+                size += os.path.getsize(os.path.join(root, name))
+    return size
+
+
+def onnx_model_path(model_path: str, quantize: bool = ONNX_QUANTIZE) -> str:
+    return os.path.join(model_path, "onnx", "model_int8.onnx" if quantize else "model.onnx")
+
+
+def export_onnx(model_path: str, quantize: bool = ONNX_QUANTIZE) -> str:
+    """把模型导出为 ONNX，quantize 为 True 时再做动态 int8 量化；已导出过的直接返回路径"""
+    output_path = onnx_model_path(model_path, quantize)
+    if os.path.exists(output_path):
+        return output_path
+
+    import torch
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+    fp32_path = onnx_model_path(model_path, quantize=False)
+    if not os.path.exists(fp32_path):
+        os.makedirs(os.path.dirname(fp32_path), exist_ok=True)
+        tokenizer = AutoTokenizer.from_pretrained(model_path)
+        model = AutoModelForSequenceClassification.from_pretrained(model_path).eval()
+        inputs = tokenizer([["query", "document"]], return_tensors="pt")
+        input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in inputs]
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+        dynamic_axes["logits"] = {0: "batch"}
+        with torch.no_grad():
+            torch.onnx.export(model, tuple(inputs[name] for name in input_names), fp32_path,
+                              input_names=input_names, output_names=["logits"],
+                              dynamic_axes=dynamic_axes, opset_version=14)
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantize_dynamic(fp32_path, output_path, weight_type=QuantType.QInt8)
+    return output_path
+
+
+class OnnxReRanker(ReRanker):
+    """用 ONNX Runtime 在 CPU 上推理的重排模型，得分与 FlagReranker(normalize=True) 一致"""
+
+    def __init__(self, model_path, batch_size: int = BATCH_SIZE, max_length: int = MAX_LENGTH,
+                 quantize: bool = ONNX_QUANTIZE, threads: int = ORT_THREADS):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path)
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(export_onnx(model_path, quantize), options,
+                                            providers=["CPUExecutionProvider"])
+        self.input_names = [node.name for node in self.session.get_inputs()]
+        self.batch_size = batch_size
+        self.max_length = max_length
+
+    @staticmethod
+    def memory_size(model_path: str) -> int:
+        path = onnx_model_path(model_path)
+        return os.path.getsize(path) if os.path.exists(path) else model_size(model_path)
+
+    def score_batch(self, pairs: List[List[str]]) -> List[float]:
+        inputs = self.tokenizer(pairs, padding=True, truncation=True, max_length=self.max_length, return_tensors="np")
+        logits = self.session.run(None, {name: inputs[name].astype(np.int64) for name in self.input_names})[0]
+        return (1 / (1 + np.exp(-logits[:, 0]))).tolist()
+
+
+RERANKERS = {"torch": ReRanker, "onnx": OnnxReRanker}
+
+
+class ModelPool(metaclass=Singleton):
+    """
+    按需加载模型，已加载的模型按最近使用排序。
+    加载新模型前，如果总大小会超出内存预算，先淘汰最久未使用的模型。
+    """
+
+    def __init__(self, model_dir: str = MODEL_DIR, models: List[str] = MODELS,
+                 memory_budget_mb: int = MEMORY_BUDGET_MB, backend: str = BACKEND):
+        self.model_dir = model_dir
+        self.models = models
+        self.reranker_class = RERANKERS[backend]
+        self.memory_budget = memory_budget_mb * 1024 * 1024
+        self._loaded = OrderedDict()
+        self._lock = threading.Lock()
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._loaded
+
+    def get(self, name: str) -> ReRanker:
+        with self._lock:
+            if name in self._loaded:
+                self._loaded.move_to_end(name)
+                return self._loaded[name][0]
+            if name not in self.models:
+                raise ValueError(f"Unknown model: {name}")
+
+            model_path = os.path.join(self.model_dir, name)
+            size = self.reranker_class.memory_size(model_path)
+            if self.memory_budget > 0:
+                while self._loaded and sum(s for _, s in self._loaded.values()) + size > self.memory_budget:
+                    evicted, _ = self._loaded.popitem(last=False)
+                    print(f"卸载模型 {evicted}")
+                    gc.collect()
+                if size > self.memory_budget:
+                    print(f"模型 {name} 的大小超出内存预算 RERANK_MEMORY_BUDGET_MB")
+            print(f"加载模型 {name}")
+            reranker = self.reranker_class(model_path)
+            self._loaded[name] = (reranker, size)
+            return reranker
+
+
+class MicroBatcher(metaclass=Singleton):
+    """
+    把并发请求的 (query, document) 对合并成一次推理，再把得分按请求拆分返回。
+    不同模型的请求在同一批中分别推理；推理（以及首次使用时的模型加载）在单独的线程中执行，
+    事件循环可以继续接收请求。
+    """
+
+    def __init__(self, pool: ModelPool, max_wait_ms: float = BATCH_WAIT_MS, max_pairs: int = MAX_BATCH_PAIRS):
+        self.pool = pool
+        self.max_wait = max_wait_ms / 1000
+        self.max_pairs = max_pairs
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self._queue = None
+        self._worker = None
+
+    async def compute_score(self, model: str, pairs: List[List[str]]) -> List[float]:
+        if len(pairs) == 0:
+            return []
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.ensure_future(self._run())
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((model, pairs, future))
+        return await future
+
+    async def load(self, model: str):
+        """在推理线程中加载模型，用于启动时预热"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self.pool.get, model)
+
+    def _score(self, model: str, pairs: List[List[str]]) -> List[float]:
+        return self.pool.get(model).compute_score(pairs)
+
+    async def _collect(self):
+        """取出第一个请求后，在 max_wait 内继续收集，直到凑满 max_pairs 对"""
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        size = len(batch[0][1])
+        deadline = loop.time() + self.max_wait
+        while size < self.max_pairs:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            batch.append(item)
+            size += len(item[1])
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            by_model = OrderedDict()
+            for model, request_pairs, future in batch:
+                by_model.setdefault(model, []).append((request_pairs, future))
+            for model, requests in by_model.items():
+                pairs = [pair for request_pairs, _ in requests for pair in request_pairs]
+                try:
+                    scores = await loop.run_in_executor(self.executor, self._score, model, pairs)
+                except Exception as e:
+                    for _, future in requests:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                offset = 0
+                for request_pairs, future in requests:
+                    if not future.done():
+                        future.set_result(scores[offset:offset + len(request_pairs)])
+                    offset += len(request_pairs)
+
+
+class ScoreCache(metaclass=Singleton):
+    """(query, document, 模型) -> 得分 的 LRU 缓存，带过期时间和命中率统计"""
+
+    def __init__(self, max_items: int = CACHE_SIZE, ttl: float = CACHE_TTL):
+        self.max_items = max_items
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(model: str, query: str, document: str) -> bytes:
+        return hashlib.sha256("\0".join([model, query, document]).encode("utf-8")).digest()
+
+    def get(self, key: bytes) -> Optional[float]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and time.time() - item[1] > self.ttl:
+                del self._items[key]
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def set(self, key: bytes, score: float):
+        if self.max_items <= 0 or self.ttl <= 0:
+            return
+        with self._lock:
+            self._items[key] = (score, time.time())
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses,
+                    "hit_rate": self.hits / total if total else 0.0, "items": len(self._items)}
+
+
+class Chat(object):
+    def __init__(self, model: str = DEFAULT_MODEL):
+        self.model = model
+        self.reranker = MicroBatcher(ModelPool())
+        self.cache = ScoreCache()
+
+    async def compute_score(self, pairs: List[List[str]]) -> List[float]:
+        """先查缓存，只有未命中的 (query, document) 对才交给模型计算"""
+        keys = [ScoreCache.key(self.model, query, doc) for query, doc in pairs]
+        scores = [self.cache.get(key) for key in keys]
+        # 同一请求中重复的文档只计算一次
+        missing = {}
+        for index, score in enumerate(scores):
+            if score is None:
+                missing.setdefault(keys[index], []).append(index)
+        if missing:
+            indexes = [positions[0] for positions in missing.values()]
+            new_scores = await self.reranker.compute_score(self.model, [pairs[index] for index in indexes])
+            for (key, positions), score in zip(missing.items(), new_scores):
+                self.cache.set(key, score)
+                for index in positions:
+                    scores[index] = score
+        return scores
+
+    async def fit_query_answer_rerank(self, query_docs) -> List:
+        if query_docs is None or len(query_docs.documents) == 0:
+            return []
+
+        pair = [[query_docs.query, doc] for doc in query_docs.documents]
+        scores = await self.compute_score(pair)
+
+        new_docs = []
+        for index, score in enumerate(scores):
+            new_docs.append({"index": index, "text": query_docs.documents[index], "score": score})
+        new_docs = sorted(new_docs, key=lambda x: x["score"], reverse=True)[:query_docs.top_n]
+        results = []
+        for documents in new_docs:
+            result = {"index": documents["index"], "relevance_score": documents["score"]}
+            if query_docs.return_documents:
+                result["document"] = {"text": documents["text"]}
+            results.append(result)
+        return results
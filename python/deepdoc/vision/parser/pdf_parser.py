@@ -264,8 +264,9 @@ class HuParser:
                 b["H_right"] = spans[ii]["x1"]
                 b["SP"] = ii
 
-    def __ocr(self, pagenum, img, chars, ZM=3):
-        bxs = self.ocr.detect(np.array(img))
+    def __ocr(self, pagenum, img, chars, ZM=3, bxs=None):
+        if bxs is None:
+            bxs = self.ocr.detect(np.array(img))
         if not bxs:
             self.boxes.append([])
             return
@@ -1011,7 +1012,12 @@ class HuParser:
             #     else:
             #         self.page_cum_height.append(
             #             np.max([c["bottom"] for c in chars]))
-            self.__ocr(i + 1, img, chars, zoomin)
+            # text detection runs on several pages at once, see TextDetector.detect_batch
+            det_batch_size = self.ocr.text_detector.batch_size
+            if i % det_batch_size == 0:
+                page_boxes = self.ocr.detect_batch(
+                    [np.array(im) for im in self.page_images[i:i + det_batch_size]])
+            self.__ocr(i + 1, img, chars, zoomin, page_boxes[i % det_batch_size])
             if callback:
                 callback(prog=(i + 1) * 0.6 / len(self.page_images), msg="")
 
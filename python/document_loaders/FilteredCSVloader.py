@@ -2,10 +2,14 @@
 
 from langchain.document_loaders import CSVLoader
 import csv
+import codecs
+import locale
 from io import TextIOWrapper
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional
 from langchain.docstore.document import Document
-from langchain.document_loaders.helpers import detect_file_encodings
+
+# 自动检测编码时读取的样本大小（字节）
+CSV_ENCODING_SAMPLE_SIZE = 1024 * 1024
 
 
 class FilteredCSVLoader(CSVLoader):
@@ -31,32 +35,36 @@ class FilteredCSVLoader(CSVLoader):
 
     def load(self) -> List[Document]:
         """Load data into document objects."""
+        return list(self.lazy_load())
 
-        docs = []
+    def lazy_load(self) -> Iterator[Document]:
+        """逐行读取 CSV 并返回 Document，内存占用与文件大小无关"""
+        encoding = self.encoding
+        if self.autodetect_encoding:
+            encoding = self.__detect_encoding()
         try:
-            with open(self.file_path, newline="", encoding=self.encoding) as csvfile:
-                docs = self.__read_file(csvfile)
-        except UnicodeDecodeError as e:
-            if self.autodetect_encoding:
-                detected_encodings = detect_file_encodings(self.file_path)
-                for encoding in detected_encodings:
-                    try:
-                        with open(
-                            self.file_path, newline="", encoding=encoding.encoding
-                        ) as csvfile:
-                            docs = self.__read_file(csvfile)
-                            break
-                    except UnicodeDecodeError:
-                        continue
-            else:
-                raise RuntimeError(f"Error loading {self.file_path}") from e
+            with open(self.file_path, newline="", encoding=encoding) as csvfile:
+                yield from self.__iter_file(csvfile)
         except Exception as e:
             raise RuntimeError(f"Error loading {self.file_path}") from e
 
-        return docs
+    def __detect_encoding(self) -> Optional[str]:
+        """
+        只读取文件开头的 CSV_ENCODING_SAMPLE_SIZE 字节：能用指定的编码解码时直接使用，
+        否则用 chardet 检测样本的编码，返回第一个能解码样本的候选编码
+        """
+        with open(self.file_path, "rb") as f:
+            sample = f.read(CSV_ENCODING_SAMPLE_SIZE)
+        candidates = [self.encoding or locale.getpreferredencoding(False)]
+        if not _decodes(sample, candidates[0]):
+            import chardet
+            candidates = [result["encoding"] for result in chardet.detect_all(sample) if result["encoding"]]
+        for encoding in candidates:
+            if _decodes(sample, encoding):
+                return encoding
+        raise RuntimeError(f"Could not detect the encoding of {self.file_path}")
 
-    def __read_file(self, csvfile: TextIOWrapper) -> List[Document]:
-        docs = []
+    def __iter_file(self, csvfile: TextIOWrapper) -> Iterator[Document]:
         csv_reader = csv.DictReader(csvfile, **self.csv_args)  # type: ignore
         for i, row in enumerate(csv_reader):
             content = []
@@ -78,7 +86,13 @@ class FilteredCSVLoader(CSVLoader):
                 if col in row:
                     metadata[col] = row[col]
 
-            doc = Document(page_content=content, metadata=metadata)
-            docs.append(doc)
+            yield Document(page_content=content, metadata=metadata)
+
 
-        return docs
+def _decodes(sample: bytes, encoding: str) -> bool:
+    """样本能否用 encoding 解码；样本末尾被截断的多字节字符不算错误"""
+    try:
+        codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+        return True
+    except (UnicodeDecodeError, LookupError):
+        return False
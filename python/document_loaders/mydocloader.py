@@ -1,78 +1,82 @@
-from langchain.document_loaders.unstructured import UnstructuredFileLoader
-from typing import List
+from langchain.docstore.document import Document
+from typing import Iterator, List
 import tqdm
+from paged_loader import PagedOCRLoader
+from ocr import get_ocr
 import sys
 import docx
 
 
+def iter_doc_blocks(filepath) -> Iterator[str]:
+    """按文档顺序逐块（段落或表格）返回文字，段落中的图片做 OCR 后接在段落文字后面"""
+    from docx.table import _Cell, Table
+    from docx.oxml.table import CT_Tbl
+    from docx.oxml.text.paragraph import CT_P
+    from docx.text.paragraph import Paragraph
+    from docx import Document, ImagePart
+    from PIL import Image
+    from io import BytesIO
+    import numpy as np
+    # 与 PDF 和图片加载器不同，docx/pptx 中的图片一直在 CPU 上用 rapidocr_onnxruntime 识别
+    ocr = get_ocr(use_cuda=False)
+    doc = Document(filepath)
 
-class RapidOCRDocLoader(UnstructuredFileLoader):
-    
-    def _get_elements(self) -> List:
-        def doc2text(filepath):
-            from docx.table import _Cell, Table
-            from docx.oxml.table import CT_Tbl
-            from docx.oxml.text.paragraph import CT_P
-            from docx.text.paragraph import Paragraph
-            from docx import Document, ImagePart
-            from PIL import Image
-            from io import BytesIO
-            import numpy as np
-            from rapidocr_onnxruntime import RapidOCR
-            ocr = RapidOCR()
-            print("wqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqqq")
-            #with open(filepath, 'rb') as f:
-            #   doc_content = f.read()
-            #docx.add_paragraph(doc_content)
-            #docx.save(filepath)
-            doc = Document(filepath)
-            resp = ""
+    def iter_block_items(parent):
+        from docx.document import Document
+        if isinstance(parent, Document):
+            parent_elm = parent.element.body
+        elif isinstance(parent, _Cell):
+            parent_elm = parent._tc
+        else:
+            raise ValueError("RapidOCRDocLoader parse fail")
 
-            def iter_block_items(parent):
-                from docx.document import Document
-                if isinstance(parent, Document):
-                    parent_elm = parent.element.body
-                elif isinstance(parent, _Cell):
-                    parent_elm = parent._tc
-                else:
-                    raise ValueError("RapidOCRDocLoader parse fail")
+        for child in parent_elm.iterchildren():
+            if isinstance(child, CT_P):
+                yield Paragraph(child, parent)
+            elif isinstance(child, CT_Tbl):
+                yield Table(child, parent)
 
-                for child in parent_elm.iterchildren():
-                    if isinstance(child, CT_P):
-                        yield Paragraph(child, parent)
-                    elif isinstance(child, CT_Tbl):
-                        yield Table(child, parent)
+    b_unit = tqdm.tqdm(total=len(doc.paragraphs)+len(doc.tables),
+                       desc="RapidOCRDocLoader block index: 0")
+    for i, block in enumerate(iter_block_items(doc)):
+        b_unit.set_description(
+            "RapidOCRDocLoader  block index: {}".format(i))
+        b_unit.refresh()
+        parts = []
+        if isinstance(block, Paragraph):
+            parts.append(block.text.strip() + "\n")
+            images = block._element.xpath('.//pic:pic')  # 获取所有图片
+            for image in images:
+                for img_id in image.xpath('.//a:blip/@r:embed'):  # 获取图片id
+                    part = doc.part.related_parts[img_id]  # 根据图片id获取对应的图片
+                    if isinstance(part, ImagePart):
+                        image = Image.open(BytesIO(part._blob))
+                        result, _ = ocr(np.array(image))
+                        if result:
+                            ocr_result = [line[1] for line in result]
+                            parts.append("\n".join(ocr_result))
+        elif isinstance(block, Table):
+            for row in block.rows:
+                for cell in row.cells:
+                    for paragraph in cell.paragraphs:
+                        parts.append(paragraph.text.strip() + "\n")
+        b_unit.update(1)
+        yield "".join(parts)
 
-            b_unit = tqdm.tqdm(total=len(doc.paragraphs)+len(doc.tables),
-                               desc="RapidOCRDocLoader block index: 0")
-            for i, block in enumerate(iter_block_items(doc)):
-                b_unit.set_description(
-                    "RapidOCRDocLoader  block index: {}".format(i))
-                b_unit.refresh()
-                if isinstance(block, Paragraph):
-                    resp += block.text.strip() + "\n"
-                    images = block._element.xpath('.//pic:pic')  # 获取所有图片
-                    for image in images:
-                        for img_id in image.xpath('.//a:blip/@r:embed'):  # 获取图片id
-                            part = doc.part.related_parts[img_id]  # 根据图片id获取对应的图片
-                            if isinstance(part, ImagePart):
-                                image = Image.open(BytesIO(part._blob))
-                                result, _ = ocr(np.array(image))
-                                if result:
-                                    ocr_result = [line[1] for line in result]
-                                    resp += "\n".join(ocr_result)
-                elif isinstance(block, Table):
-                    for row in block.rows:
-                        for cell in row.cells:
-                            for paragraph in cell.paragraphs:
-                                resp += paragraph.text.strip() + "\n"
-                b_unit.update(1)
-            return resp
 
-        text = doc2text(self.file_path)
+class RapidOCRDocLoader(PagedOCRLoader):
+    
+    def _get_elements(self) -> List:
+        text = "".join(iter_doc_blocks(self.file_path))
         from unstructured.partition.text import partition_text
         return partition_text(text=text, **self.unstructured_kwargs)
 
+    def lazy_load(self) -> Iterator[Document]:
+        """逐块（段落或表格）返回 Document，跳过空白的块；metadata 中的 block 为块在文档中的序号，从 0 开始"""
+        for i, text in enumerate(iter_doc_blocks(self.file_path)):
+            if text.strip():
+                yield Document(page_content=text, metadata={"source": self.file_path, "block": i})
+
 
 if __name__ == '__main__':
     loader = RapidOCRDocLoader(file_path=sys.argv[1])
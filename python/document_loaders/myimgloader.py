@@ -1,23 +1,88 @@
-from typing import List
-from langchain.document_loaders.unstructured import UnstructuredFileLoader
-from ocr import get_ocr
+import os
+import math
+from typing import Iterator, List
+from langchain.docstore.document import Document
+from paged_loader import PagedOCRLoader
+from ocr import get_ocr, get_ocr_pool
 import sys
 
-class RapidOCRLoader(UnstructuredFileLoader):
+# 多页 TIFF 并行识别（可选，默认关闭）：TIFF_OCR_WORKERS 大于 1 且帧数不少于 TIFF_PARALLEL_MIN_FRAMES 时，
+# 把帧范围分给常驻的工作进程池（与 PDF 共用 get_ocr_pool）同时识别
+TIFF_OCR_WORKERS = int(os.environ.get("TIFF_OCR_WORKERS", 1))
+TIFF_PARALLEL_MIN_FRAMES = int(os.environ.get("TIFF_PARALLEL_MIN_FRAMES", 8))
+
+
+def is_tiff(filepath) -> bool:
+    return os.path.splitext(filepath)[1].lower() in (".tif", ".tiff")
+
+
+def img2text(img, ocr) -> str:
+    """img 为图片路径或数组"""
+    result, _ = ocr(img)
+    if result:
+        return "\n".join(line[1] for line in result)
+    return ""
+
+
+def iter_tiff_range(filepath, start, end) -> Iterator[str]:
+    """逐帧识别 [start, end) 范围内的帧，帧直接解码为数组，不经过 PDF 转换"""
+    from PIL import Image
+    import numpy as np
+    ocr = get_ocr()
+    with Image.open(filepath) as img:
+        for i in range(start, end):
+            img.seek(i)
+            yield img2text(np.array(img.convert("RGB")), ocr)
+
+
+def tiff_frames2text(filepath, start, end) -> List[str]:
+    return list(iter_tiff_range(filepath, start, end))
+
+
+def iter_tiff_frames(filepath, workers: int = TIFF_OCR_WORKERS) -> Iterator[str]:
+    """按顺序逐帧返回识别结果；帧数较多且 workers > 1 时多个进程并行识别"""
+    from PIL import Image
+    with Image.open(filepath) as img:
+        n_frames = getattr(img, "n_frames", 1)
+
+    if workers <= 1 or n_frames < TIFF_PARALLEL_MIN_FRAMES:
+        yield from iter_tiff_range(filepath, 0, n_frames)
+        return
+
+    chunk = max(1, math.ceil(n_frames / (workers * 4)))
+    ranges = [(start, min(start + chunk, n_frames)) for start in range(0, n_frames, chunk)]
+    pool = get_ocr_pool(workers)
+    futures = [pool.submit(tiff_frames2text, filepath, start, end) for start, end in ranges]
+    try:
+        for future in futures:
+            yield from future.result()
+    finally:
+        # 调用方提前结束时，不再处理还没开始的帧范围
+        for future in futures:
+            future.cancel()
+
+
+class RapidOCRLoader(PagedOCRLoader):
+    def __init__(self, file_path, mode: str = "single", workers: int = TIFF_OCR_WORKERS, **unstructured_kwargs):
+        self.workers = workers
+        super().__init__(file_path, mode=mode, **unstructured_kwargs)
+
+    def _iter_texts(self) -> Iterator[str]:
+        if is_tiff(self.file_path):
+            yield from iter_tiff_frames(self.file_path, self.workers)
+        else:
+            yield img2text(self.file_path, get_ocr())
+
     def _get_elements(self) -> List:
-        def img2text(filepath):
-            resp = ""
-            ocr = get_ocr()
-            result, _ = ocr(filepath)
-            if result:
-                ocr_result = [line[1] for line in result]
-                resp += "\n".join(ocr_result)
-            return resp
-
-        text = img2text(self.file_path)
+        text = "\n".join(self._iter_texts())
         from unstructured.partition.text import partition_text
         return partition_text(text=text, **self.unstructured_kwargs)
 
+    def lazy_load(self) -> Iterator[Document]:
+        """逐帧返回 Document（普通图片只有一帧），metadata 中的 page 从 0 开始"""
+        for i, text in enumerate(self._iter_texts()):
+            yield Document(page_content=text, metadata={"source": self.file_path, "page": i})
+
 
 if __name__ == "__main__":
     #loader = RapidOCRLoader(file_path="../tests/samples/ocr_test.jpg")
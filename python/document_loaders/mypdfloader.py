@@ -1,18 +1,14 @@
 import os
 import sys
-from typing import List
-from langchain.document_loaders.unstructured import UnstructuredFileLoader
+from typing import Iterator, List
+from langchain.docstore.document import Document
 import cv2
 from PIL import Image
 import numpy as np
 import nltk
-from reportlab.pdfgen import canvas
-import reportlab
-import PIL
 #import unoconv
 
 import os
-import subprocess
 from PyPDF2 import PdfMerger, PdfReader
 
 #import sys
@@ -20,117 +16,233 @@ from PyPDF2 import PdfMerger, PdfReader
 #from configs.kb_config import PDF_OCR_THRESHOLD
 #from configs.kb_config import PDF_OCR_THRESHOLD
 #import configs.kb_config.PDF_OCR_THRESHOLD
-from ocr import get_ocr
+from paged_loader import PagedOCRLoader
+from ocr import get_ocr, get_ocr_pool
+from office_pool import get_office_pool
 import tqdm
 import re
+import math
+import uuid
+import hashlib
+import threading
+from collections import OrderedDict
 
 # PDF OCR 控制：只对宽高超过页面一定比例（图片宽/页面宽，图片高/页面高）的图片进行 OCR。
 # 这样可以避免 PDF 中一些小图片的干扰，提高非扫描版 PDF 处理速度
 PDF_OCR_THRESHOLD = (0.6, 0.6)
+# PDF 并行处理（可选，默认关闭）：PDF_OCR_WORKERS 大于 1 且页数不少于 PDF_PARALLEL_MIN_PAGES 时，
+# 把页范围分给常驻的 OCR 进程池同时处理，进程池在第一次使用时创建，之后所有文档共用
+PDF_OCR_WORKERS = int(os.environ.get("PDF_OCR_WORKERS", 1))
+PDF_PARALLEL_MIN_PAGES = int(os.environ.get("PDF_PARALLEL_MIN_PAGES", 8))
+# 跨文档的 OCR 结果缓存：按图片像素的哈希值缓存最近 PDF_OCR_PIXEL_CACHE_SIZE 张图片的识别结果，0 表示关闭
+# 同一文档内相同 xref 的图片（信头、背景扫描等）总是只识别一次
+PDF_OCR_PIXEL_CACHE_SIZE = 256
+# 并行处理时，每个工作进程按文档保留 (xref, 旋转角度) -> 识别结果，同一文档分到这个进程的所有页范围共用，
+# 最多保留最近 PDF_OCR_MEMO_DOCS 个文档
+PDF_OCR_MEMO_DOCS = 8
 NLTK_DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "nltk_data")
 nltk.data.path = [NLTK_DATA_PATH] + nltk.data.path
 
-def convert(tiff, out = "out.pdf"):
-    outPDF = canvas.Canvas(out, pageCompression=1)
-    img = PIL.Image.open(tiff)
-    for page in range(img.n_frames):
-        img.seek(page)
-        imgPage = reportlab.lib.utils.ImageReader(img)
-        outPDF.drawImage(imgPage, 0, 0, 595, 841)
-        if page < img.n_frames:
-            outPDF.showPage()
-    outPDF.save()
-    img.close()
-
-def convert_doc(doc, out = "out.pdf"):
-    proc = subprocess.Popen(f'unoconv -f pdf "{doc}"',
-            shell=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            stdin=subprocess.PIPE
-        )
-    out, err = proc.communicate()
-    print("87777777777777777777")
-    print(out)
-    print("000009999999")
-   
-
-class RapidOCRPDFLoader(UnstructuredFileLoader):
-    def _get_elements(self) -> List:
-        def rotate_img(img, angle):
-            '''
-            img   --image
-            angle --rotation angle
-            return--rotated img
-            '''
-            
-            h, w = img.shape[:2]
-            rotate_center = (w/2, h/2)
-            #获取旋转矩阵
-            # 参数1为旋转中心点;
-            # 参数2为旋转角度,正值-逆时针旋转;负值-顺时针旋转
-            # 参数3为各向同性的比例因子,1.0原图，2.0变成原来的2倍，0.5变成原来的0.5倍
-            M = cv2.getRotationMatrix2D(rotate_center, angle, 1.0)
-            #计算图像新边界
-            new_w = int(h * np.abs(M[0, 1]) + w * np.abs(M[0, 0]))
-            new_h = int(h * np.abs(M[0, 0]) + w * np.abs(M[0, 1]))
-            #调整旋转矩阵以考虑平移
-            M[0, 2] += (new_w - w) / 2
-            M[1, 2] += (new_h - h) / 2
-
-            rotated_img = cv2.warpAffine(img, M, (new_w, new_h))
-            return rotated_img
-        
-        def pdf2text(filepath):
-            import fitz # pyMuPDF里面的fitz包，不要与pip install fitz混淆
-            import numpy as np
-            ocr = get_ocr()
-            doc = fitz.open(filepath)
-            resp = ""
-
-            b_unit = tqdm.tqdm(total=doc.page_count, desc="RapidOCRPDFLoader context page index: 0")
+def convert_doc(doc, timeout=None) -> bytes:
+    """用常驻的 LibreOffice 进程把 .doc 等 office 文件转换为 PDF，返回 PDF 内容，不在磁盘上留下文件"""
+    return get_office_pool().convert(doc, timeout)
+
+
+def rotate_img(img, angle):
+    '''
+    img   --image
+    angle --rotation angle
+    return--rotated img
+    '''
+    
+    h, w = img.shape[:2]
+    rotate_center = (w/2, h/2)
+    #获取旋转矩阵
+    # 参数1为旋转中心点;
+    # 参数2为旋转角度,正值-逆时针旋转;负值-顺时针旋转
+    # 参数3为各向同性的比例因子,1.0原图，2.0变成原来的2倍，0.5变成原来的0.5倍
+    M = cv2.getRotationMatrix2D(rotate_center, angle, 1.0)
+    #计算图像新边界
+    new_w = int(h * np.abs(M[0, 1]) + w * np.abs(M[0, 0]))
+    new_h = int(h * np.abs(M[0, 0]) + w * np.abs(M[0, 1]))
+    #调整旋转矩阵以考虑平移
+    M[0, 2] += (new_w - w) / 2
+    M[1, 2] += (new_h - h) / 2
+
+    rotated_img = cv2.warpAffine(img, M, (new_w, new_h))
+    return rotated_img
+
+
+class PixelOCRCache:
+    """图片像素哈希 -> OCR 结果 的 LRU 缓存，进程内所有文档共用"""
+
+    def __init__(self, max_items: int = PDF_OCR_PIXEL_CACHE_SIZE):
+        self.max_items = max_items
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            text = self._items.get(key)
+            if text is not None:
+                self._items.move_to_end(key)
+            return text
+
+    def set(self, key, text):
+        if self.max_items <= 0:
+            return
+        with self._lock:
+            self._items[key] = text
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+
+pixel_ocr_cache = PixelOCRCache()
+
+_doc_memos = OrderedDict()
+_doc_memos_lock = threading.Lock()
+
+
+def document_memo(doc_id: str) -> dict:
+    """当前进程中 doc_id 对应文档的图片识别结果（见 image2text），工作进程常驻，跨页范围保留"""
+    with _doc_memos_lock:
+        memo = _doc_memos.get(doc_id)
+        if memo is None:
+            memo = _doc_memos[doc_id] = {}
+        _doc_memos.move_to_end(doc_id)
+        while len(_doc_memos) > PDF_OCR_MEMO_DOCS:
+            _doc_memos.popitem(last=False)
+        return memo
+
+
+def image2text(doc, xref, rotation, ocr, memo) -> str:
+    """
+    识别 PDF 中的一张图片。memo 为当前文档的 {(xref, 页面旋转角度): 识别结果}，
+    同一张图片在其他页面再次出现时直接返回；旋转角度不同时旋转后的图片不同，需要分别识别
+    """
+    import fitz # pyMuPDF里面的fitz包，不要与pip install fitz混淆
+    key = (xref, rotation)
+    if key in memo:
+        return memo[key]
+
+    pix = fitz.Pixmap(doc, xref)
+    pixel_key = None
+    if pixel_ocr_cache.max_items > 0:
+        pixel_key = (hashlib.sha1(pix.samples).hexdigest(), pix.width, pix.height, pix.n, rotation)
+        text = pixel_ocr_cache.get(pixel_key)
+        if text is not None:
+            memo[key] = text
+            return text
+
+    if rotation!=0:  #如果Page有旋转角度，则旋转图片
+        img_array = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, -1)
+        tmp_img = Image.fromarray(img_array);
+        # 将numpy array转成np.uint8类型
+        ori_img = cv2.cvtColor(np.array(tmp_img),cv2.COLOR_RGB2BGR)
+        rot_img = rotate_img(img=ori_img, angle=360-rotation)
+        img_array = cv2.cvtColor(rot_img, cv2.COLOR_RGB2BGR)
+    else:
+        img_array = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, -1)
+
+    result, _ = ocr(img_array)
+    text = "\n".join(line[1] for line in result) if result else ""
+    memo[key] = text
+    if pixel_key is not None:
+        pixel_ocr_cache.set(pixel_key, text)
+    return text
+
+
+def page2text(doc, page, ocr, memo=None) -> str:
+    """提取一页的文字，并对超过阈值的图片做 OCR；memo 为当前文档的图片识别结果，见 image2text"""
+    memo = {} if memo is None else memo
+    parts = [page.get_text(""), "\n"]
+
+    img_list = page.get_image_info(xrefs=True)
+    for img in img_list:
+        if xref := img.get("xref"):
+            bbox = img["bbox"]
+            # 检查图片尺寸是否超过设定的阈值
+            if ((bbox[2] - bbox[0]) / (page.rect.width) < PDF_OCR_THRESHOLD[0]
+                or (bbox[3] - bbox[1]) / (page.rect.height) < PDF_OCR_THRESHOLD[1]):
+                continue
+            text = image2text(doc, xref, int(page.rotation), ocr, memo)
+            if text:
+                parts.append(text)
+    return "".join(parts)
+
+
+def open_pdf(filepath):
+    """filepath 为 PDF 路径或 PDF 内容（bytes）"""
+    import fitz
+    if isinstance(filepath, bytes):
+        return fitz.open(stream=filepath, filetype="pdf")
+    return fitz.open(filepath)
+
+
+def pdf_pages2text(filepath, start, end, doc_id) -> List[str]:
+    """
+    提取 [start, end) 范围内每一页的文字；在工作进程中执行时，每个进程自己打开 PDF、使用自己的 OCR 引擎，
+    同一文档（doc_id 相同）的图片识别结果在这个进程处理的所有页范围之间共用
+    """
+    ocr = get_ocr()
+    memo = document_memo(doc_id)
+    with open_pdf(filepath) as doc:
+        return [page2text(doc, doc[i], ocr, memo) for i in range(start, end)]
+
+
+def iter_pdf_pages(filepath, workers: int = PDF_OCR_WORKERS) -> Iterator[str]:
+    """
+    按页码顺序逐页返回文字。页数较多且 workers > 1 时，把页范围分给多个进程并行处理，
+    前面的页范围完成后立即返回，不等待整个文件
+    """
+    with open_pdf(filepath) as doc:
+        page_count = doc.page_count
+
+    b_unit = tqdm.tqdm(total=page_count, desc="RapidOCRPDFLoader context page index: 0")
+    if workers <= 1 or page_count < PDF_PARALLEL_MIN_PAGES:
+        ocr = get_ocr()
+        memo = {}
+        with open_pdf(filepath) as doc:
             for i, page in enumerate(doc):
                 b_unit.set_description("RapidOCRPDFLoader context page index: {}".format(i))
                 b_unit.refresh()
-                text = page.get_text("")
-                resp += text + "\n"
-
-                img_list = page.get_image_info(xrefs=True)
-                for img in img_list:
-                    if xref := img.get("xref"):
-                        bbox = img["bbox"]
-                        # 检查图片尺寸是否超过设定的阈值
-                        if ((bbox[2] - bbox[0]) / (page.rect.width) < PDF_OCR_THRESHOLD[0]
-                            or (bbox[3] - bbox[1]) / (page.rect.height) < PDF_OCR_THRESHOLD[1]):
-                            continue
-                        pix = fitz.Pixmap(doc, xref)
-                        samples = pix.samples
-                        if int(page.rotation)!=0:  #如果Page有旋转角度，则旋转图片
-                            img_array = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, -1)
-                            #img_array = img_array.astype(np.uint8) #zzpfox
-                            #img_array = np.random.randint(0, 34, (5, 4), dtype=np.uint8)#zzpfox
-                            tmp_img = Image.fromarray(img_array);
-                            #tmp_img = Image.fromarray((img_array.transpose(1,2,0) * 255).astype(np.uint8))
-                            # 将numpy array转成np.uint8类型
-                            ori_img = cv2.cvtColor(np.array(tmp_img),cv2.COLOR_RGB2BGR)
-                            rot_img = rotate_img(img=ori_img, angle=360-page.rotation)
-                            img_array = cv2.cvtColor(rot_img, cv2.COLOR_RGB2BGR)
-                        else:
-                            img_array = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, -1)
-
-                        result, _ = ocr(img_array)
-                        if result:
-                            ocr_result = [line[1] for line in result]
-                            resp += "\n".join(ocr_result)
-
+                yield page2text(doc, page, ocr, memo)
                 # 更新进度
                 b_unit.update(1)
-            return resp
+        return
+
+    # 每个进程分到多个较小的页范围，扫描页和文字页混在一起时负载更均衡
+    chunk = max(1, math.ceil(page_count / (workers * 4)))
+    ranges = [(start, min(start + chunk, page_count)) for start in range(0, page_count, chunk)]
+    pool = get_ocr_pool(workers)
+    doc_id = uuid.uuid4().hex
+    futures = [pool.submit(pdf_pages2text, filepath, start, end, doc_id) for start, end in ranges]
+    try:
+        for future in futures:
+            pages = future.result()
+            b_unit.update(len(pages))
+            yield from pages
+    finally:
+        # 调用方提前结束时，不再处理还没开始的页范围
+        for future in futures:
+            future.cancel()
+
+
+class RapidOCRPDFLoader(PagedOCRLoader):
+    def __init__(self, file_path, mode: str = "single", workers: int = PDF_OCR_WORKERS, **unstructured_kwargs):
+        self.workers = workers
+        super().__init__(file_path, mode=mode, **unstructured_kwargs)
 
-        text = pdf2text(self.file_path)
+    def _get_elements(self) -> List:
+        text = "".join(iter_pdf_pages(self.file_path, self.workers))
         from unstructured.partition.text import partition_text
         return partition_text(text=text, **self.unstructured_kwargs)
 
+    def lazy_load(self) -> Iterator[Document]:
+        """逐页返回 Document，metadata 中的 page 从 0 开始"""
+        for i, text in enumerate(iter_pdf_pages(self.file_path, self.workers)):
+            yield Document(page_content=text, metadata={"source": self.file_path, "page": i})
 
  
 def remove_extra_returns(text):
@@ -148,19 +260,18 @@ def remove_extra_returns(text):
 #print(cleaned_text)
 
 if __name__ == "__main__":
-    if "tif" in sys.argv[1] :#or "doc" in sys.argv[1]
-        convert(sys.argv[1])
-        loader = RapidOCRPDFLoader(file_path="out.pdf")
-        #loader = RapidOCRPDFLoader(file_path='C:/Users/20230715/AppData/Local/Temp/GSDJNbRHfB7n.pdf')
+    file_ext = os.path.splitext(sys.argv[1])[1].lower()
+    if file_ext in (".tif", ".tiff"):
+        # 多页 TIFF 直接逐帧识别，不再转换为 PDF
+        from myimgloader import RapidOCRLoader
+        loader = RapidOCRLoader(file_path=sys.argv[1])
         docs = loader.load()
         #print(docs)
         docss=remove_extra_returns(docs[0].page_content)
         print(docss)    
-    if  "doc" in sys.argv[1]:
-        convert_doc(sys.argv[1])
-        loader = RapidOCRPDFLoader(file_path="out.pdf")
-        docs = loader.load()
-        docss=remove_extra_returns(docs[0].page_content)
+    elif file_ext == ".doc":
+        pdf = convert_doc(sys.argv[1])
+        docss=remove_extra_returns("".join(iter_pdf_pages(pdf)))
         print(docss)
     else:
         loader = RapidOCRPDFLoader(file_path=sys.argv[1])
@@ -1,57 +1,65 @@
-from langchain.document_loaders.unstructured import UnstructuredFileLoader
-from typing import List
+from langchain.docstore.document import Document
+from typing import Iterator, List
 import tqdm
+from paged_loader import PagedOCRLoader
+from ocr import get_ocr
 
 
-class RapidOCRPPTLoader(UnstructuredFileLoader):
+def iter_ppt_slides(filepath) -> Iterator[str]:
+    """逐页返回幻灯片中的文字，每页内的形状从上到下、从左到右排列，图片做 OCR"""
+    from pptx import Presentation
+    from PIL import Image
+    import numpy as np
+    from io import BytesIO
+    # 与 PDF 和图片加载器不同，docx/pptx 中的图片一直在 CPU 上用 rapidocr_onnxruntime 识别
+    ocr = get_ocr(use_cuda=False)
+    prs = Presentation(filepath)
+
+    def extract_text(shape, parts):
+        if shape.has_text_frame:
+            parts.append(shape.text.strip() + "\n")
+        if shape.has_table:
+            for row in shape.table.rows:
+                for cell in row.cells:
+                    for paragraph in cell.text_frame.paragraphs:
+                        parts.append(paragraph.text.strip() + "\n")
+        if shape.shape_type == 13:  # 13 表示图片
+            image = Image.open(BytesIO(shape.image.blob))
+            result, _ = ocr(np.array(image))
+            if result:
+                ocr_result = [line[1] for line in result]
+                parts.append("\n".join(ocr_result))
+        elif shape.shape_type == 6:  # 6 表示组合
+            for child_shape in shape.shapes:
+                extract_text(child_shape, parts)
+
+    b_unit = tqdm.tqdm(total=len(prs.slides),
+                       desc="RapidOCRPPTLoader slide index: 1")
+    # 遍历所有幻灯片
+    for slide_number, slide in enumerate(prs.slides, start=1):
+        b_unit.set_description(
+            "RapidOCRPPTLoader slide index: {}".format(slide_number))
+        b_unit.refresh()
+        sorted_shapes = sorted(slide.shapes,
+                               key=lambda x: (x.top, x.left))  # 从上到下、从左到右遍历
+        parts = []
+        for shape in sorted_shapes:
+            extract_text(shape, parts)
+        b_unit.update(1)
+        yield "".join(parts)
+
+
+class RapidOCRPPTLoader(PagedOCRLoader):
     def _get_elements(self) -> List:
-        def ppt2text(filepath):
-            from pptx import Presentation
-            from PIL import Image
-            import numpy as np
-            from io import BytesIO
-            from rapidocr_onnxruntime import RapidOCR
-            ocr = RapidOCR()
-            prs = Presentation(filepath)
-            resp = ""
-
-            def extract_text(shape):
-                nonlocal resp
-                if shape.has_text_frame:
-                    resp += shape.text.strip() + "\n"
-                if shape.has_table:
-                    for row in shape.table.rows:
-                        for cell in row.cells:
-                            for paragraph in cell.text_frame.paragraphs:
-                                resp += paragraph.text.strip() + "\n"
-                if shape.shape_type == 13:  # 13 表示图片
-                    image = Image.open(BytesIO(shape.image.blob))
-                    result, _ = ocr(np.array(image))
-                    if result:
-                        ocr_result = [line[1] for line in result]
-                        resp += "\n".join(ocr_result)
-                elif shape.shape_type == 6:  # 6 表示组合
-                    for child_shape in shape.shapes:
-                        extract_text(child_shape)
-
-            b_unit = tqdm.tqdm(total=len(prs.slides),
-                               desc="RapidOCRPPTLoader slide index: 1")
-            # 遍历所有幻灯片
-            for slide_number, slide in enumerate(prs.slides, start=1):
-                b_unit.set_description(
-                    "RapidOCRPPTLoader slide index: {}".format(slide_number))
-                b_unit.refresh()
-                sorted_shapes = sorted(slide.shapes,
-                                       key=lambda x: (x.top, x.left))  # 从上到下、从左到右遍历
-                for shape in sorted_shapes:
-                    extract_text(shape)
-                b_unit.update(1)
-            return resp
-
-        text = ppt2text(self.file_path)
+        text = "".join(iter_ppt_slides(self.file_path))
         from unstructured.partition.text import partition_text
         return partition_text(text=text, **self.unstructured_kwargs)
 
+    def lazy_load(self) -> Iterator[Document]:
+        """逐页返回 Document，metadata 中的 slide 为幻灯片序号，从 0 开始"""
+        for i, text in enumerate(iter_ppt_slides(self.file_path)):
+            yield Document(page_content=text, metadata={"source": self.file_path, "slide": i})
+
 
 if __name__ == '__main__':
     loader = RapidOCRPPTLoader(file_path="../tests/samples/ocr_test.pptx")
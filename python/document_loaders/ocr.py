@@ -1,3 +1,9 @@
+import os
+import queue
+import functools
+import threading
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
 from typing import TYPE_CHECKING
 #import paddle
 
@@ -10,7 +16,19 @@ if TYPE_CHECKING:
         from rapidocr_onnxruntime import RapidOCR
 
 
-def get_ocr(use_cuda: bool = True) -> "RapidOCR":
+# 每个进程、每种设置最多加载的 OCR 引擎数。一个引擎同一时间只识别一张图片，
+# 多个线程同时识别时最多 OCR_ENGINES 张图片并行，其余排队；引擎按需创建，单线程使用时只加载一个
+OCR_ENGINES = int(os.environ.get("OCR_ENGINES", 2))
+
+
+def create_ocr(use_cuda: bool = True) -> "RapidOCR":
+    """use_cuda 为 True 时优先使用 rapidocr_paddle（GPU）；为 False 时使用 CPU 上的 rapidocr_onnxruntime"""
+    if not use_cuda:
+        try:
+            from rapidocr_onnxruntime import RapidOCR
+            return RapidOCR()
+        except ImportError:
+            pass
     try:
         #from rapidocr_onnxruntime import RapidOCR
         #ocr = RapidOCR()
@@ -24,3 +42,79 @@ def get_ocr(use_cuda: bool = True) -> "RapidOCR":
         ocr = RapidOCR()
         #ocr=""
     return ocr
+
+
+class SharedOCR:
+    """
+    进程内共享的 OCR 引擎池，多个线程可以同时调用。
+    每次调用借用一个空闲的引擎，没有空闲引擎且数量未达到 size 时创建新的引擎，否则等待
+    """
+
+    def __init__(self, factory, size: int = OCR_ENGINES):
+        self.factory = factory
+        self.size = max(1, size)
+        # 后进先出：单线程使用时总是复用同一个引擎
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            create = self._created < self.size
+            if create:
+                self._created += 1
+        if not create:
+            return self._idle.get()
+        try:
+            return self.factory()
+        except BaseException:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def __call__(self, *args, **kwargs):
+        engine = self._acquire()
+        try:
+            return engine(*args, **kwargs)
+        finally:
+            self._idle.put(engine)
+
+
+# OCR 引擎注册表：每个进程、每种设置只创建一个引擎池，所有加载器共用
+# 键中带上进程号，fork 出的子进程会加载自己的引擎，不会使用父进程的实例
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_ocr(use_cuda: bool = True) -> SharedOCR:
+    key = (os.getpid(), use_cuda)
+    ocr = _engines.get(key)
+    if ocr is None:
+        with _engines_lock:
+            ocr = _engines.get(key)
+            if ocr is None:
+                ocr = _engines[key] = SharedOCR(functools.partial(create_ocr, use_cuda))
+    return ocr
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_ocr_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    多进程 OCR 使用的进程池，每个进程中相同 workers 只创建一个，之后所有文档共用。
+    工作进程常驻，OCR 模型在每个工作进程中只加载一次；
+    使用 spawn 启动，避免 fork 后继承父进程中已初始化的 OCR 引擎（CUDA 上下文不能跨 fork 使用）
+    """
+    key = (os.getpid(), workers)
+    with _pools_lock:
+        pool = _pools.get(key)
+        # 工作进程异常退出后进程池不能再使用，重新创建
+        if pool is None or getattr(pool, "_broken", False):
+            pool = _pools[key] = ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn"))
+    return pool
@@ -0,0 +1,210 @@
+## 常驻的 LibreOffice 转换服务：保持多个无界面的 soffice 监听进程，避免每个文件都冷启动一次 office
+
+import os
+import queue
+import shutil
+import socket
+import tempfile
+import threading
+import subprocess
+import time
+import atexit
+from typing import Optional
+
+# 同时运行的 soffice 进程数
+OFFICE_POOL_SIZE = 2
+# 最多排队等待的转换任务数，超出时 convert 直接报错
+OFFICE_QUEUE_SIZE = 16
+# 单个文件的转换时限（秒），超时后重启对应的 soffice 进程
+OFFICE_JOB_TIMEOUT = 120
+# soffice 进程启动并开始监听的时限（秒）
+OFFICE_START_TIMEOUT = 30
+
+
+class OfficeQueueFullError(RuntimeError):
+    pass
+
+
+def free_port() -> int:
+    """由系统分配一个当前空闲的本地端口"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def listening_inodes(port: int) -> set:
+    """/proc/net/tcp 中监听 port 的 socket inode"""
+    inodes = set()
+    with open("/proc/net/tcp") as f:
+        next(f)
+        for line in f:
+            fields = line.split()
+            if fields[3] == "0A" and int(fields[1].split(":")[1], 16) == port:
+                inodes.add(fields[9])
+    return inodes
+
+
+def process_tree(pid: int) -> set:
+    """pid 及其所有子孙进程（soffice 启动脚本会再启动 soffice.bin）"""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    tree, stack = set(), [pid]
+    while stack:
+        p = stack.pop()
+        tree.add(p)
+        stack.extend(children.get(p, []))
+    return tree
+
+
+def owns_listener(pid: int, port: int) -> bool:
+    """port 上的监听 socket 是否属于 pid 启动的进程；没有 /proc 时无法判断，视为属于"""
+    if not os.path.exists("/proc/net/tcp"):
+        return True
+    targets = {f"socket:[{inode}]" for inode in listening_inodes(port)}
+    for p in process_tree(pid):
+        try:
+            fds = os.listdir(f"/proc/{p}/fd")
+        except OSError:
+            continue
+        for fd in fds:
+            try:
+                if os.readlink(f"/proc/{p}/fd/{fd}") in targets:
+                    return True
+            except OSError:
+                continue
+    return False
+
+
+class OfficeInstance:
+    """
+    一个无界面的 soffice 监听进程，每个进程使用独立的用户配置目录，可以同时运行。
+    每次启动都由系统分配空闲端口，多个 API 进程或残留的 soffice 不会占用同一个端口
+    """
+
+    def __init__(self):
+        self.port = None
+        self.connection = None
+        self.profile_dir = tempfile.mkdtemp(prefix="soffice_")
+        self.process = None
+
+    def alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def start(self, timeout: float = OFFICE_START_TIMEOUT):
+        self.stop()
+        self.port = free_port()
+        self.connection = f"socket,host=127.0.0.1,port={self.port};urp;StarOffice.ComponentContext"
+        self.process = subprocess.Popen(
+            ["soffice", "--headless", "--invisible", "--nologo", "--norestore", "--nodefault",
+             f"--accept={self.connection}", f"-env:UserInstallation=file://{self.profile_dir}"],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, stdin=subprocess.DEVNULL)
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if not self.alive():
+                raise RuntimeError(f"soffice exited while starting on port {self.port}")
+            try:
+                with socket.create_connection(("127.0.0.1", self.port), timeout=1):
+                    pass
+            except OSError:
+                time.sleep(0.2)
+                continue
+            # 端口在分配后被其他进程抢先监听时，连接到的不是这个 soffice
+            if owns_listener(self.process.pid, self.port):
+                return
+            self.stop()
+            raise RuntimeError(f"port {self.port} is held by a process other than this soffice")
+        self.stop()
+        raise RuntimeError(f"soffice did not start listening on port {self.port} within {timeout}s")
+
+    def stop(self):
+        if self.process is not None:
+            if self.process.poll() is None:
+                self.process.kill()
+            self.process.wait()
+            self.process = None
+
+    def close(self):
+        self.stop()
+        shutil.rmtree(self.profile_dir, ignore_errors=True)
+
+    def convert(self, filepath: str, timeout: float) -> bytes:
+        """用 unoconv 连接这个进程把文件转换为 PDF，PDF 内容从 stdout 读取，不写入磁盘"""
+        proc = subprocess.run(
+            ["unoconv", "--no-launch", f"--connection={self.connection}", "-f", "pdf", "--stdout", filepath],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.DEVNULL, timeout=timeout)
+        if proc.returncode != 0 or not proc.stdout:
+            raise RuntimeError(f"unoconv failed for {filepath}: {proc.stderr.decode(errors='replace').strip()}")
+        return proc.stdout
+
+
+class OfficeConverterPool:
+    """
+    保持 size 个 soffice 进程常驻，转换任务取一个空闲进程执行。
+    排队的任务超过 queue_size 时报错；任务超时或 soffice 崩溃时重启对应的进程。
+    """
+
+    def __init__(self, size: int = OFFICE_POOL_SIZE, queue_size: int = OFFICE_QUEUE_SIZE,
+                 timeout: float = OFFICE_JOB_TIMEOUT):
+        self.timeout = timeout
+        self.instances = [OfficeInstance() for _ in range(size)]
+        self._idle = queue.Queue()
+        for instance in self.instances:
+            self._idle.put(instance)
+        # 正在执行和排队的任务共用 size + queue_size 个名额
+        self._slots = threading.BoundedSemaphore(size + queue_size)
+
+    def convert(self, filepath: str, timeout: Optional[float] = None) -> bytes:
+        timeout = self.timeout if timeout is None else timeout
+        if not self._slots.acquire(blocking=False):
+            raise OfficeQueueFullError("Too many office conversions queued")
+        try:
+            instance = self._idle.get()
+            try:
+                if not instance.alive():
+                    instance.start()
+                try:
+                    return instance.convert(filepath, timeout)
+                except subprocess.TimeoutExpired:
+                    instance.stop()
+                    raise TimeoutError(f"Converting {filepath} took longer than {timeout}s")
+                except RuntimeError:
+                    # soffice 崩溃时，下一个任务使用这个进程前会重新启动
+                    if not instance.alive():
+                        instance.stop()
+                    raise
+            finally:
+                self._idle.put(instance)
+        finally:
+            self._slots.release()
+
+    def warmup(self):
+        for instance in self.instances:
+            if not instance.alive():
+                instance.start()
+
+    def close(self):
+        for instance in self.instances:
+            instance.close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_office_pool() -> OfficeConverterPool:
+    """进程内共享的转换服务，第一次使用时创建，进程退出时关闭所有 soffice 进程"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = OfficeConverterPool()
+                atexit.register(_pool.close)
+    return _pool
@@ -0,0 +1,44 @@
+from typing import List
+from langchain.document_loaders.unstructured import UnstructuredFileLoader
+from langchain.docstore.document import Document
+
+
+class PagedOCRLoader(UnstructuredFileLoader):
+    """
+    RapidOCR 系列加载器的基类。
+    load() 保持原有行为：全文经 _get_elements 切分后按 mode（single / elements / paged）组装 Document，
+    unstructured_kwargs 照常生效；lazy_load() 由子类实现，逐页/块/帧返回 Document，
+    metadata 中的序号（page / block / slide）统一从 0 开始。
+    新版 langchain 的 BaseLoader.load() 等于 list(self.lazy_load())，因此这里显式重写 load()。
+    """
+
+    def load(self) -> List[Document]:
+        elements = self._get_elements()
+        self._post_process_elements(elements)
+        if self.mode == "single":
+            text = "\n\n".join(str(el) for el in elements)
+            return [Document(page_content=text, metadata=self._get_metadata())]
+
+        if self.mode == "elements":
+            docs = []
+            for element in elements:
+                metadata = self._get_metadata()
+                if hasattr(element, "metadata"):
+                    metadata.update(element.metadata.to_dict())
+                if hasattr(element, "category"):
+                    metadata["category"] = element.category
+                docs.append(Document(page_content=str(element), metadata=metadata))
+            return docs
+
+        if self.mode == "paged":
+            texts, metas = {}, {}
+            for element in elements:
+                metadata = self._get_metadata()
+                if hasattr(element, "metadata"):
+                    metadata.update(element.metadata.to_dict())
+                page_number = metadata.get("page_number", 1)
+                texts[page_number] = texts.get(page_number, "") + str(element) + "\n\n"
+                metas.setdefault(page_number, {}).update(metadata)
+            return [Document(page_content=texts[key], metadata=metas[key]) for key in texts]
+
+        raise ValueError(f"mode of {self.mode} not supported.")